@@ -0,0 +1,432 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+
+import faiss
+import numpy as np
+import onnxruntime
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))) # windows 배포 시, 같은 경로 파일 import 위해 필요
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE" # windows 배포 시, ONNX 와 FAISS 의 OpenMP 충돌 우회를 위해 필요
+
+import dist_onnx
+from dist_onnx import (
+    RESIZE_SIZE, TransformedDataset, load_onnx_model, create_memory_bank, compute_anomaly_map, compute_anomaly_maps,
+    top_mean_scores, set_num_threads
+)
+from common import ApproximateGreedyCoresetSampler, FaissNN, FEATURE_PRECISIONS
+from profiler import StageProfiler
+from onnx_session import detect_providers
+
+# 실제 백본과 같은 출력 형태: 이미지 1장 (1, 256, 256, 3) -> (32*32 패치, feature_dim)
+PATCH_SIDE = 32
+BENCH_IMAGE_SIZE = 320  # 중앙 크롭 후 RESIZE_SIZE 로 리사이즈되는 원본 크기
+# 정밀도별 점수 오차 측정용 held-out 이미지 (메모리 뱅크에 쓰지 않은 seed 로 생성)
+# A_TEST: 결함 없는 이미지, B_TEST: 모든 이미지에 결함
+TEST_IMAGES = 10
+
+
+class TinyBackbone(torch.nn.Module):
+    """
+    (N, H, W, C) 0~255 입력을 받아 (N*32*32, feature_dim) 패치 특징을 내는 작은 백본
+    실제 모델처럼 정규화를 모델 안에 포함
+    """
+    def __init__(self, feature_dim):
+        super().__init__()
+        self.conv1 = torch.nn.Conv2d(3, 32, kernel_size=3, stride=2, padding=1)
+        self.conv2 = torch.nn.Conv2d(32, feature_dim, kernel_size=3, stride=2, padding=1)
+        self.pool = torch.nn.AdaptiveAvgPool2d(PATCH_SIDE)
+
+    def forward(self, x):
+        x = x.permute(0, 3, 1, 2) / 255.0
+        x = torch.relu(self.conv1(x))
+        x = self.pool(self.conv2(x))
+        return x.permute(0, 2, 3, 1).reshape(-1, x.shape[1])
+
+
+def build_tiny_model(model_path, feature_dim, seed=0):
+    """TinyBackbone 을 ONNX 로 export (가중치는 seed 로 고정)"""
+    torch.manual_seed(seed)
+    model = TinyBackbone(feature_dim).eval()
+    dummy = torch.zeros(1, RESIZE_SIZE, RESIZE_SIZE, 3)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    torch.onnx.export(model, dummy, model_path, input_names=["input"], output_names=["features"],
+                      opset_version=13)
+    return model_path
+
+
+def make_synthetic_images(folder, count, seed=0, size=BENCH_IMAGE_SIZE, defect_rate=0.5):
+    """
+    부드러운 그라디언트 + 노이즈 + 임의의 사각형 결함 (defect_rate 확률) 을 가진 PNG 이미지 count 장 생성
+    (실제 이미지처럼 디코딩 비용이 들도록 압축 가능한 패턴 사용)
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.RandomState(seed)
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    for i in range(count):
+        base = np.stack([xx, yy, (xx + yy) / 2], axis=-1) * rng.uniform(120, 200, size=3)
+        img = base + rng.normal(0, 8, size=base.shape)
+        if rng.rand() < defect_rate:
+            x0, y0 = rng.randint(0, size - 40, size=2)
+            img[y0:y0 + rng.randint(8, 40), x0:x0 + rng.randint(8, 40)] = rng.uniform(0, 255, size=3)
+        Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(os.path.join(folder, f"img_{i:05d}.png"))
+    return folder
+
+
+def time_call(fn, repeat):
+    """fn 을 repeat 번 실행한 소요 시간(초) 리스트와 마지막 반환값"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def summarize_times(times, items=None):
+    summary = {
+        "seconds_median": round(statistics.median(times), 6),
+        "seconds_min": round(min(times), 6),
+        "runs": len(times),
+    }
+    if items:
+        summary["per_item_ms"] = round(statistics.median(times) / items * 1000, 4)
+    return summary
+
+
+def relative_error(values, reference):
+    """reference 대비 상대 오차의 최대 / 평균"""
+    rel = np.abs(values - reference) / np.maximum(np.abs(reference), 1e-12)
+    return {"max_rel_err": float(rel.max()) if rel.size else 0.0,
+            "mean_rel_err": float(rel.mean()) if rel.size else 0.0}
+
+
+def score_error(scores, reference):
+    """
+    held-out (a_scores, b_scores) 의 reference 대비 이미지별 점수 절대 오차와 B-A 평균 점수 차이 변화
+    (정상 이미지 점수는 0 에 가까울 수 있어 상대 오차 대신 절대 오차 사용)
+    """
+    diff = np.abs(np.concatenate(scores) - np.concatenate(reference))
+    gap = float(np.mean(scores[1]) - np.mean(scores[0]))
+    reference_gap = float(np.mean(reference[1]) - np.mean(reference[0]))
+    return {
+        "score_max_abs_err": float(diff.max()) if diff.size else 0.0,
+        "score_mean_abs_err": float(diff.mean()) if diff.size else 0.0,
+        "gap_fp32": reference_gap,
+        "gap_abs_err": abs(gap - reference_gap),
+    }
+
+
+def bench_dataset_size(work_dir, image_folder, model, num_images, repeat, seed, precision="fp32",
+                       test_loaders=None):
+    """
+    이미지 num_images 장으로 create_memory_bank / compute_anomaly_map(s) 측정
+    create_memory_bank 는 StageProfiler 로 단계별 시간도 함께 기록
+    test_loaders: (A_TEST, B_TEST) 데이터로더, 주어지면 메모리 뱅크에 쓰지 않은 이미지로 점수 계산
+    반환: (결과 리스트, (A_TEST, B_TEST) 이미지별 top 10% 평균 점수 또는 None) - 정밀도별 점수 오차 비교용
+    """
+    dataset = TransformedDataset(image_folder, transform=None, resize=True, limit=num_images, seed=seed)
+    loader = DataLoader(dataset, batch_size=1, shuffle=False, num_workers=0)
+    memory_bank_folder = os.path.join(work_dir, f"memory_dist_{num_images}_{precision}")
+    os.makedirs(memory_bank_folder, exist_ok=True)
+
+    results = []
+    times = []
+    mb_mgr = None
+    profile = None
+    for _ in range(repeat):
+        with StageProfiler() as profiler:
+            start = time.perf_counter()
+            mb_mgr = create_memory_bank([image_folder], model, [loader],
+                                        memory_bank_folder=memory_bank_folder, seed=seed, precision=precision)
+            times.append(time.perf_counter() - start)
+        profile = profiler.record()
+    results.append({
+        "stage": "create_memory_bank",
+        "dataset_size": num_images,
+        "precision": precision,
+        **summarize_times(times, num_images),
+        "breakdown": profile["stages"],
+        "peak_rss_mb": profile["peak_rss_mb"],
+    })
+
+    imgs = [img for img, _ in loader]
+    def score_all():
+        for img in imgs:
+            compute_anomaly_map(img, mb_mgr, model)
+    times, _ = time_call(score_all, repeat)
+    results.append({
+        "stage": "compute_anomaly_map",
+        "dataset_size": num_images,
+        "precision": precision,
+        **summarize_times(times, len(imgs)),
+    })
+
+    # 같은 이미지를 배치 FAISS 검색으로 점수화 (A.func 가 사용하는 경로)
+    times, (anomaly_maps, _) = time_call(lambda: compute_anomaly_maps(loader, mb_mgr, model), repeat)
+    results.append({
+        "stage": "compute_anomaly_maps",
+        "dataset_size": num_images,
+        "precision": precision,
+        **summarize_times(times, len(imgs)),
+    })
+
+    # 메모리 뱅크 이미지는 자기 자신과 거리가 0 이므로 점수 비교는 held-out A_TEST / B_TEST 로 계산 (시간 측정 제외)
+    if test_loaders is None:
+        return results, None
+    scores = tuple(top_mean_scores(compute_anomaly_maps(test_loader, mb_mgr, model, desc=desc)[0], 0.1)
+                   for test_loader, desc in zip(test_loaders, ("[A_TEST Anomaly Maps]", "[B_TEST Anomaly Maps]")))
+    results[-1]["gap"] = float(np.mean(scores[1]) - np.mean(scores[0]))
+    return results, scores
+
+
+def bench_bank_size(bank_size, feature_dim, oversample, num_query_images, repeat, device, num_threads, seed,
+                    precisions=("fp32",)):
+    """
+    무작위 특징으로 ApproximateGreedyCoresetSampler (bank_size * oversample -> bank_size) 와
+    FaissNN fit / search (query: num_query_images 장 분량의 패치) 를 정밀도별로 측정
+    fp32 가 아닌 정밀도는 fp32 대비 coreset 선택 일치율, 최근접 거리 오차 / 이웃 일치율을 함께 기록
+    """
+    rng = np.random.RandomState(seed)
+    features = rng.standard_normal((bank_size * oversample, feature_dim)).astype(np.float32)
+    queries = rng.standard_normal((num_query_images * PATCH_SIDE * PATCH_SIDE, feature_dim)).astype(np.float32)
+
+    # coreset 입력 버퍼: fp32, 그리고 fp16 / sq8 이 공통으로 쓰는 float16 버퍼
+    results = []
+    buffers = [("fp32", features)]
+    if any(p != "fp32" for p in precisions):
+        buffers.append(("fp16", features.astype(np.float16)))
+    reference_indices = None
+    reference_bank = None
+    for buffer_precision, buffer in buffers:
+        sampler = ApproximateGreedyCoresetSampler(1.0 / oversample, device, seed=seed)
+        times, (bank, indices) = time_call(lambda: sampler.run(buffer, return_indices=True), repeat)
+        result = {
+            "stage": "coreset_sampling",
+            "bank_size": bank_size,
+            "precision": buffer_precision,
+            "input_size": len(features),
+            "buffer_mb": round(buffer.nbytes / 2 ** 20, 2),
+            **summarize_times(times, bank_size),
+        }
+        if reference_indices is None:
+            reference_indices, reference_bank = indices, bank
+        else:
+            result["coreset_overlap"] = round(len(np.intersect1d(indices, reference_indices)) / len(reference_indices), 6)
+        results.append(result)
+
+    # 증분 메모리 뱅크: 앞 1/4 (A_TRAIN 에 해당) 의 base coreset 에 이어서 나머지 (ColorJitter 3회분) 만 선택
+    base_rows = len(features) // 4
+    sampler = ApproximateGreedyCoresetSampler(1.0 / oversample, device, seed=seed)
+    base_coreset = sampler.run(features[:base_rows])
+    times, _ = time_call(lambda: sampler.run(features[base_rows:], selected_features=base_coreset), repeat)
+    results.append({"stage": "coreset_incremental", "bank_size": bank_size, "precision": "fp32",
+                    "input_size": len(features) - base_rows, "base_size": len(base_coreset),
+                    **summarize_times(times, bank_size)})
+
+    reference_search = None
+    for precision in ("fp32", *[p for p in precisions if p != "fp32"]):
+        # 인덱스 정밀도 비교는 같은 (fp32 coreset) 뱅크로 측정
+        nn = FaissNN(False, num_threads or 8, precision)
+        times, _ = time_call(lambda: nn.fit(reference_bank), repeat)
+        results.append({"stage": "faiss_fit", "bank_size": bank_size, "precision": precision,
+                        **summarize_times(times, bank_size)})
+
+        times, (distances, neighbours) = time_call(lambda: nn.run(1, queries), repeat)
+        result = {
+            "stage": "faiss_search",
+            "bank_size": bank_size,
+            "precision": precision,
+            "query_size": len(queries),
+            **summarize_times(times, num_query_images),
+        }
+        if reference_search is None:
+            reference_search = (distances, neighbours)
+        else:
+            result.update(relative_error(distances[:, 0], reference_search[0][:, 0]))
+            result["nn_agreement"] = round(float(np.mean(neighbours[:, 0] == reference_search[1][:, 0])), 6)
+        results.append(result)
+    return results
+
+
+def result_key(result):
+    """baseline 비교용 키 (stage + 크기 파라미터)"""
+    return (result["stage"], result.get("dataset_size"), result.get("bank_size"), result.get("precision", "fp32"))
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """
+    baseline 보고서와 같은 키의 중앙값을 비교하여 ratio 를 기록
+    ratio > tolerance 인 항목을 회귀로 표시하고 회귀 목록 반환
+    """
+    baseline_results = {result_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        base = baseline_results.get(result_key(result))
+        if base is None or not base.get("seconds_median"):
+            continue
+        ratio = result["seconds_median"] / base["seconds_median"]
+        result["baseline_seconds_median"] = base["seconds_median"]
+        result["ratio"] = round(ratio, 4)
+        if ratio > tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def environment_info():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "cuda": torch.cuda.is_available(),
+    }
+    info["onnxruntime"] = onnxruntime.__version__
+    info["onnxruntime_providers"] = detect_providers()
+    info["faiss"] = getattr(faiss, "__version__", None)
+    return info
+
+
+def parse_sizes(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="anomaly scoring 파이프라인 합성 데이터 벤치마크")
+    parser.add_argument("--dataset_sizes", type=str, default="10,40",
+                        help="create_memory_bank / compute_anomaly_map 에 사용할 이미지 수 (쉼표 구분)")
+    parser.add_argument("--bank_sizes", type=str, default="500,2000",
+                        help="coreset / FAISS 측정용 메모리 뱅크 크기 (쉼표 구분)")
+    parser.add_argument("--oversample", type=int, default=10, help="coreset 입력 특징 수 = bank_size * oversample")
+    parser.add_argument("--query_images", type=int, default=10, help="FAISS search 측정용 query 이미지 수")
+    parser.add_argument("--test_images", type=int, default=TEST_IMAGES,
+                        help="정밀도별 점수 오차 측정용 held-out A_TEST / B_TEST 이미지 수 (0 이면 측정 안 함)")
+    parser.add_argument("--precisions", type=str, default="fp32,fp16,sq8",
+                        help=f"측정할 메모리 뱅크 정밀도 {FEATURE_PRECISIONS} (쉼표 구분), fp32 대비 오차도 기록")
+    parser.add_argument("--feature_dim", type=int, default=384, help="합성 백본의 특징 차원")
+    parser.add_argument("--repeat", type=int, default=3, help="측정 반복 횟수 (중앙값 / 최소값 보고)")
+    parser.add_argument("--num_threads", type=int, default=None, help="CPU 스레드 수 (없으면 라이브러리 기본값)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work_dir", type=str, default=None, help="합성 데이터 폴더 (없으면 임시 폴더 후 삭제)")
+    parser.add_argument("--output", type=str, default=None, help="결과 JSON 저장 경로 (없으면 stdout)")
+    parser.add_argument("--baseline", type=str, default=None, help="비교할 이전 결과 JSON")
+    parser.add_argument("--tolerance", type=float, default=1.2,
+                        help="baseline 대비 중앙값 비율이 이 값을 넘으면 회귀로 보고 (exit code 1)")
+    args = parser.parse_args()
+
+    dataset_sizes = parse_sizes(args.dataset_sizes)
+    bank_sizes = parse_sizes(args.bank_sizes)
+    precisions = [p.strip() for p in args.precisions.split(",") if p.strip()]
+    unknown = [p for p in precisions if p not in FEATURE_PRECISIONS]
+    if unknown:
+        parser.error(f"알 수 없는 precision: {unknown}")
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="iqgen_bench_")
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if args.num_threads is not None:
+        set_num_threads(args.num_threads)
+    regressions = []
+
+    try:
+        # 파이프라인의 진행 상황 출력이 결과 JSON 과 섞이지 않도록 stderr 로 보냄
+        with contextlib.redirect_stdout(sys.stderr):
+            image_folder = os.path.join(work_dir, "images")
+            if not os.path.isdir(image_folder) or len(os.listdir(image_folder)) < max(dataset_sizes, default=0):
+                make_synthetic_images(image_folder, max(dataset_sizes, default=0), seed=args.seed)
+            model_path = os.path.join(work_dir, "models", f"tiny_{args.feature_dim}.onnx")
+            if not os.path.exists(model_path):
+                build_tiny_model(model_path, args.feature_dim, seed=args.seed)
+            model = load_onnx_model(model_path)
+
+            # held-out A_TEST (결함 없음) / B_TEST (모두 결함): 메모리 뱅크 이미지와 다른 seed 로 생성
+            test_loaders = None
+            if args.test_images > 0:
+                test_loaders = []
+                for name, offset, defect_rate in (("a_test", 1, 0.0), ("b_test", 2, 1.0)):
+                    test_folder = os.path.join(work_dir, name)
+                    if not os.path.isdir(test_folder) or len(os.listdir(test_folder)) < args.test_images:
+                        make_synthetic_images(test_folder, args.test_images, seed=args.seed + offset,
+                                              defect_rate=defect_rate)
+                    dataset = TransformedDataset(test_folder, transform=None, resize=True, limit=args.test_images,
+                                                 seed=args.seed)
+                    test_loaders.append(DataLoader(dataset, batch_size=1, shuffle=False, num_workers=0))
+
+            results = []
+            for num_images in dataset_sizes:
+                reference_scores = None
+                for precision in ("fp32", *[p for p in precisions if p != "fp32"]):
+                    print(f"[Bench] dataset_size={num_images}, precision={precision}", file=sys.stderr)
+                    dataset_results, scores = bench_dataset_size(work_dir, image_folder, model, num_images,
+                                                                 args.repeat, args.seed, precision, test_loaders)
+                    if reference_scores is None:
+                        reference_scores = scores
+                    elif scores is not None:
+                        # 정밀도에 따른 held-out 이미지별 anomaly score (top 10% 평균) 오차와 B-A 점수 차이 변화
+                        dataset_results[-1].update(score_error(scores, reference_scores))
+                    results += dataset_results
+            for bank_size in bank_sizes:
+                print(f"[Bench] bank_size={bank_size}", file=sys.stderr)
+                results += bench_bank_size(bank_size, args.feature_dim, args.oversample, args.query_images,
+                                           args.repeat, device, dist_onnx.NUM_THREADS, args.seed, precisions)
+
+        report = {
+            "config": {
+                "dataset_sizes": dataset_sizes,
+                "bank_sizes": bank_sizes,
+                "oversample": args.oversample,
+                "query_images": args.query_images,
+                "test_images": args.test_images,
+                "feature_dim": args.feature_dim,
+                "precisions": precisions,
+                "repeat": args.repeat,
+                "num_threads": args.num_threads,
+                "seed": args.seed,
+                "device": str(device),
+            },
+            "environment": environment_info(),
+            "results": results,
+        }
+
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                regressions = compare_with_baseline(report, json.load(f), args.tolerance)
+            report["regressions"] = [result_key(r) for r in regressions]
+            for r in regressions:
+                print(f"[Bench] 회귀: {result_key(r)} ratio={r['ratio']}", file=sys.stderr)
+
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text)
+            print(f"[Bench] 결과 저장: {args.output}", file=sys.stderr)
+        else:
+            print(text)
+
+    except KeyboardInterrupt:
+        print("\n[Bench] 사용자에 의해 중단되었습니다.", file=sys.stderr)
+    except Exception as e:
+        print(f"[Bench] 오류 발생: {e}", file=sys.stderr)
+        traceback.print_exc()
+        sys.exit(2)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ from typing import List, Union
 from torch import nn
 from torchvision.datasets import ImageFolder
 
+from profiler import profile_stage
+
 def init_weight(m):
 
     if isinstance(m, torch.nn.Linear):
@@ -19,24 +21,61 @@ def init_weight(m):
     elif isinstance(m, torch.nn.Conv2d):
         torch.nn.init.xavier_normal_(m.weight)
 
-def get_memory_bank_manager(coreset_ratio=None, device=None):
-    return MemoryBankManager(coreset_ratio, device)
+# 메모리 뱅크 특징 저장 정밀도 (torch / faiss 없이 import 할 수 있도록 feature_cache 에 정의)
+from feature_cache import FEATURE_PRECISIONS
+
+def get_memory_bank_manager(coreset_ratio=None, device=None, num_threads=None, seed=None, precision="fp32"):
+    return MemoryBankManager(coreset_ratio, device, num_threads, seed, precision)
 
 class MemoryBankManager:
-    def __init__(self, coreset_ratio=None, device=None):
+    def __init__(self, coreset_ratio=None, device=None, num_threads=None, seed=None, precision="fp32"):
+        # num_threads: FAISS OpenMP 스레드 수 (None 이면 기존 기본값 8)
+        # seed: coreset 샘플링 seed (None 이면 매번 다른 결과)
+        # precision: coreset 이전 특징 버퍼 / FAISS 인덱스 저장 정밀도 (FEATURE_PRECISIONS 참고)
+        if precision not in FEATURE_PRECISIONS:
+            raise ValueError(f"precision must be one of {FEATURE_PRECISIONS}, got {precision!r}")
+        self.precision = precision
+        self.feature_dtype = np.float32 if precision == "fp32" else np.float16
         self.anomaly_scorer = NearestNeighbourScorer(
-            n_nearest_neighbours=1, nn_method=FaissNN(False, 8))
+            n_nearest_neighbours=1, nn_method=FaissNN(False, num_threads or 8, precision))
         if device is None:
             self.featuresampler = None
         else:
-            self.featuresampler = ApproximateGreedyCoresetSampler(coreset_ratio, device)
+            self.featuresampler = ApproximateGreedyCoresetSampler(coreset_ratio, device, seed=seed)
 
-    def fill_memory_bank(self, features):
-        """Computes and sets the support features for SPADE."""
-        features = np.concatenate(features, axis=0)
-        features = self.featuresampler.run(features)
+    def create_feature_buffer(self, num_rows):
+        """num_rows 개 패치 특징을 담을 버퍼 (precision 에 맞는 dtype), 채운 뒤 fill_memory_bank 에 전달"""
+        return FeatureBuffer(num_rows, self.feature_dtype)
 
-        self.anomaly_scorer.fit(detection_features=[features])
+    def fill_memory_bank(self, features, base=None):
+        """Computes and sets the support features for SPADE.
+
+        features: FeatureBuffer, [N x D] 배열, 또는 배열 리스트 (리스트만 이어 붙이면서 복사됨)
+        base: 이미 채워진 MemoryBankManager (증분 메모리 뱅크)
+            주어지면 base coreset 에 이어서 features 에서만 greedy 선택하고,
+            base FAISS 인덱스의 복사본에 선택된 특징만 추가 (base 는 변경되지 않음)
+        """
+        if isinstance(features, FeatureBuffer):
+            features = features.view()
+        elif not isinstance(features, np.ndarray):
+            with profile_stage("feature_concat"):
+                features = np.concatenate(features, axis=0)
+        if base is not None and base.precision != self.precision:
+            raise ValueError(f"base precision {base.precision!r} != {self.precision!r}")
+        with profile_stage("coreset_sampling"):
+            if base is None:
+                features = self.featuresampler.run(features)
+            else:
+                features = self.featuresampler.run(
+                    features, selected_features=base.anomaly_scorer.detection_features)
+
+        with profile_stage("faiss_fit"):
+            # FAISS 는 float32 입력만 받음 (fp16 / sq8 인덱스는 내부에서 다시 양자화)
+            features = np.ascontiguousarray(features, dtype=np.float32)
+            if base is None:
+                self.anomaly_scorer.fit(detection_features=[features])
+            else:
+                self.anomaly_scorer.fit_incremental(base.anomaly_scorer, detection_features=[features])
 
     def save(self, save_folder, patch_shape):
         self.anomaly_scorer.save(save_folder)
@@ -55,12 +94,60 @@ class MemoryBankManager:
         scores = self.anomaly_scorer.predict([features])[0]
         return scores.reshape(1, *(self.patch_shape[0])) # NOTE 앞에 1은 inference() 내부 m = m[0, ...] 에 대응하기 위한 변환
 
+    def predict_batch(self, features_list, patch_shape=None):
+        """
+        여러 이미지의 패치 특징을 한 번의 FAISS 검색으로 점수화
+        features_list: 이미지별 [P x D] 배열 리스트 (모든 이미지의 패치 수 P 가 같아야 함)
+            또는 이미 이어 붙인 [num_images * P x D] 배열 (복사 없이 그대로 검색)
+        반환: [num_images x H x W] 점수 (predict() 를 이미지마다 호출한 결과와 동일)
+        """
+        if patch_shape is not None:
+            self.patch_shape = patch_shape
+        if isinstance(features_list, np.ndarray):
+            features = features_list
+        else:
+            features = np.concatenate(features_list, axis=0)
+        scores = self.anomaly_scorer.predict([features])[0]
+        return scores.reshape(-1, *(self.patch_shape[0]))
+
     def predict_no_reshape(self, features):
         scores = self.anomaly_scorer.predict([features])[0]
         # reshape 없이 반환
         return scores
 
 
+class FeatureBuffer:
+    """
+    미리 할당한 [num_rows x D] 특징 버퍼에 배치를 차례로 복사해 넣는 버퍼
+    특징 리스트를 모아 np.concatenate 할 때의 중복 복사 없이 sampler 에 그대로 전달 가능
+    """
+    def __init__(self, num_rows, dtype=np.float32):
+        self.num_rows = num_rows
+        self.dtype = dtype
+        self.data = None  # 첫 배치에서 특징 차원을 알게 되면 할당
+        self.size = 0
+
+    def append(self, features):
+        if self.data is None:
+            self.data = np.empty((self.num_rows, features.shape[-1]), dtype=self.dtype)
+        end = self.size + len(features)
+        if end > len(self.data):
+            # 예상보다 많이 들어온 경우에만 늘림 (복사 발생)
+            grown = np.empty((max(end, 2 * len(self.data)), self.data.shape[1]), dtype=self.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = features
+        self.size = end
+
+    def view(self):
+        """채워진 부분 (복사 없는 view)"""
+        return self.data[:self.size]
+
+    def clear(self):
+        """할당한 버퍼는 그대로 두고 비움 (다시 채워서 재사용)"""
+        self.size = 0
+
+
 class PatchMaker:
     def __init__(self, patchsize, top_k=0, stride=None):
         self.patchsize = patchsize
@@ -179,6 +266,14 @@ class NearestNeighbourScorer(object):
         )
         self.nn_method.fit(self.detection_features)
 
+    def fit_incremental(self, base_scorer, detection_features: List[np.ndarray]) -> None:
+        """base_scorer 가 fit 한 특징 / 인덱스에 detection_features 를 더한 상태로 fit (base_scorer 는 그대로)"""
+        features = self.feature_merger.merge(
+            detection_features,
+        )
+        self.detection_features = np.concatenate([base_scorer.detection_features, features], axis=0)
+        self.nn_method.extend(base_scorer.nn_method.search_index, features)
+
     def predict(
         self, query_features: List[np.ndarray]
     ) -> Union[np.ndarray, np.ndarray, np.ndarray]:
@@ -245,15 +340,17 @@ class NearestNeighbourScorer(object):
 
 
 class FaissNN(object):
-    def __init__(self, on_gpu: bool = False, num_workers: int = 4) -> None:
+    def __init__(self, on_gpu: bool = False, num_workers: int = 4, precision: str = "fp32") -> None:
         """FAISS Nearest neighbourhood search.
 
         Args:
             on_gpu: If set true, nearest neighbour searches are done on GPU.
             num_workers: Number of workers to use with FAISS for similarity search.
+            precision: "fp32" (IndexFlatL2), "fp16" or "sq8" (IndexScalarQuantizer, CPU only).
         """
         faiss.omp_set_num_threads(num_workers)
         self.on_gpu = on_gpu
+        self.precision = precision
         self.search_index = None
 
     def _gpu_cloner_options(self):
@@ -278,6 +375,10 @@ class FaissNN(object):
             return faiss.GpuIndexFlatL2(
                 faiss.StandardGpuResources(), dimension, faiss.GpuIndexFlatConfig()
             )
+        if self.precision == "fp16":
+            return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+        if self.precision == "sq8":
+            return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
         return faiss.IndexFlatL2(dimension)
 
     def fit(self, features: np.ndarray) -> None:
@@ -293,8 +394,20 @@ class FaissNN(object):
         self._train(self.search_index, features)
         self.search_index.add(features)
 
+    def extend(self, base_index, features: np.ndarray) -> None:
+        """
+        base_index 의 복사본에 features 를 추가하여 검색 인덱스로 사용 (base_index 는 변경하지 않음)
+        sq8 은 base_index 에서 학습한 값 범위를 그대로 사용
+        """
+        if self.search_index:
+            self.reset_index()
+        self.search_index = self._index_to_gpu(faiss.clone_index(self._index_to_cpu(base_index)))
+        self.search_index.add(features)
+
     def _train(self, _index, _features):
-        pass
+        # SQ8 은 차원별 값 범위를 학습해야 함 (flat / fp16 은 학습 불필요)
+        if not _index.is_trained:
+            _index.train(_features)
 
     def run(
         self,
@@ -336,6 +449,9 @@ class _BaseMerger:
 
     def merge(self, features: list):
         features = [self._reduce(feature) for feature in features]
+        if len(features) == 1:
+            # 하나뿐이면 concatenate 복사 없이 그대로 사용
+            return features[0]
         return np.concatenate(features, axis=1)
 
 
@@ -369,36 +485,68 @@ class BaseSampler(abc.ABC):
         return features.to(self.features_device)
 
 
+# float16 특징을 128 차원으로 투영할 때 한 번에 float32 로 변환하는 행 수
+REDUCE_CHUNK_SIZE = 65536
+# 기존 coreset 까지의 최소 거리를 구할 때 한 번에 계산하는 행 수 (chunk x coreset 크기 거리 행렬)
+MIN_DISTANCE_CHUNK_SIZE = 8192
+
 class GreedyCoresetSampler(BaseSampler):
     def __init__(
         self,
         percentage: float,
         device: torch.device,
         dimension_to_project_features_to=128,
+        seed: int = None,
     ):
-        """Greedy Coreset sampling base class."""
+        """Greedy Coreset sampling base class.
+
+        Args:
+            seed: Seed for the random projection and starting points. If None,
+                the global RNG state is used.
+        """
         super().__init__(percentage)
 
         self.device = device
         self.dimension_to_project_features_to = dimension_to_project_features_to
+        self.seed = seed
 
-    def _reduce_features(self, features):
+    def _create_mapper(self, dimension):
+        if self.seed is None:
+            mapper = torch.nn.Linear(
+                dimension, self.dimension_to_project_features_to, bias=False
+            )
+        else:
+            # Initialise the projection from the seed without touching the global RNG.
+            with torch.random.fork_rng(devices=[]):
+                torch.manual_seed(self.seed)
+                mapper = torch.nn.Linear(
+                    dimension, self.dimension_to_project_features_to, bias=False
+                )
+        return mapper.to(self.device)
+
+    def _reduce_features(self, features, mapper=None):
         if features.shape[1] == self.dimension_to_project_features_to:
-            return features
-        mapper = torch.nn.Linear(
-            features.shape[1], self.dimension_to_project_features_to, bias=False
-        )
-        _ = mapper.to(self.device)
+            return features.float()
+        if mapper is None:
+            mapper = self._create_mapper(features.shape[1])
+        if features.dtype != torch.float32:
+            # float16 버퍼 전체를 float32 로 복사하지 않도록 나눠서 투영
+            with torch.no_grad():
+                return torch.cat([mapper(chunk.to(self.device).float())
+                                  for chunk in features.split(REDUCE_CHUNK_SIZE)])
         features = features.to(self.device)
         return mapper(features)
 
     def run(
-        self, features: Union[torch.Tensor, np.ndarray], return_indices=False
+        self, features: Union[torch.Tensor, np.ndarray], return_indices=False, selected_features=None
     ) -> Union[torch.Tensor, np.ndarray]:
         """Subsamples features using Greedy Coreset.
 
         Args:
             features: [N x D]
+            selected_features: [M x D] 이미 선택된 coreset (예: A_TRAIN 의 base coreset)
+                주어지면 이 coreset 까지의 최소 거리에서 시작하여 features 에서만 이어서 선택
+                (반환값에는 새로 선택된 features 만 포함)
         """
         self._store_type(features)
         if isinstance(features, np.ndarray):
@@ -407,11 +555,23 @@ class GreedyCoresetSampler(BaseSampler):
         (Pdb) p features.shape
             torch.Size([235520, 1536])
         """
-        reduced_features = self._reduce_features(features)
+        # features 와 selected_features 는 같은 투영을 사용해야 거리가 의미 있음
+        mapper = None
+        if features.shape[1] != self.dimension_to_project_features_to:
+            mapper = self._create_mapper(features.shape[1])
+        reduced_features = self._reduce_features(features, mapper)
+        anchor_distances = None
+        if selected_features is not None:
+            if isinstance(selected_features, np.ndarray):
+                selected_features = torch.from_numpy(selected_features)
+            with torch.no_grad():
+                anchor_distances = self._compute_min_distances(
+                    reduced_features, self._reduce_features(selected_features, mapper))
         try:
-            sample_indices = self._compute_greedy_coreset_indices(reduced_features)
+            sample_indices = self._compute_greedy_coreset_indices(reduced_features, anchor_distances)
         except:
-            sample_indices = self._compute_greedy_coreset_indices(reduced_features.cpu())
+            sample_indices = self._compute_greedy_coreset_indices(
+                reduced_features.cpu(), None if anchor_distances is None else anchor_distances.cpu())
 
         features = features[sample_indices]
         if return_indices:
@@ -431,15 +591,26 @@ class GreedyCoresetSampler(BaseSampler):
 
         return (-2 * a_times_b + a_times_a + b_times_b).clamp(0, None).sqrt()
 
-    def _compute_greedy_coreset_indices(self, features: torch.Tensor) -> np.ndarray:
+    def _compute_min_distances(self, features: torch.Tensor, selected: torch.Tensor) -> torch.Tensor:
+        """features 각 행에서 selected 중 가장 가까운 점까지의 거리 [N x 1] (N x M 행렬을 나눠서 계산)"""
+        return torch.cat([
+            self._compute_batchwise_differences(chunk, selected.to(chunk.device)).min(dim=1).values
+            for chunk in features.split(MIN_DISTANCE_CHUNK_SIZE)
+        ]).reshape(-1, 1)
+
+    def _compute_greedy_coreset_indices(self, features: torch.Tensor, anchor_distances=None) -> np.ndarray:
         """Runs iterative greedy coreset selection.
 
         Args:
             features: [NxD] input feature bank to sample.
+            anchor_distances: [Nx1] 이미 선택된 coreset 까지의 최소 거리 (None 이면 처음부터 선택)
         """
         distance_matrix = self._compute_batchwise_differences(
             features, features)
-        coreset_anchor_distances = torch.norm(distance_matrix, dim=1)
+        if anchor_distances is None:
+            coreset_anchor_distances = torch.norm(distance_matrix, dim=1)
+        else:
+            coreset_anchor_distances = anchor_distances.reshape(-1)
 
         coreset_indices = []
         num_coreset_samples = int(len(features) * self.percentage)
@@ -468,13 +639,14 @@ class ApproximateGreedyCoresetSampler(GreedyCoresetSampler):
         number_of_starting_points: int = 10,
         dimension_to_project_features_to: int = 128,
         num_coreset_samples: int = None,
+        seed: int = None,
     ):
         """Approximate Greedy Coreset sampling base class."""
         self.number_of_starting_points = number_of_starting_points
         self.num_coreset_samples = num_coreset_samples
-        super().__init__(percentage, device, dimension_to_project_features_to)
+        super().__init__(percentage, device, dimension_to_project_features_to, seed)
 
-    def _compute_greedy_coreset_indices(self, features: torch.Tensor) -> np.ndarray:
+    def _compute_greedy_coreset_indices(self, features: torch.Tensor, anchor_distances=None) -> np.ndarray:
         """Runs approximate iterative greedy coreset selection.
 
         This greedy coreset implementation does not require computation of the
@@ -483,21 +655,26 @@ class ApproximateGreedyCoresetSampler(GreedyCoresetSampler):
 
         Args:
             features: [NxD] input feature bank to sample.
+            anchor_distances: [Nx1] 이미 선택된 coreset 까지의 최소 거리
+                (주어지면 임의 시작점 대신 이 거리에서 이어서 선택)
         """
-        number_of_starting_points = np.clip(
-            self.number_of_starting_points, None, len(features)
-        )  # --> 10
-        start_points = np.random.choice(
-            len(features), number_of_starting_points, replace=False
-        ).tolist()  # --> 10 개 indices
-
-        approximate_distance_matrix = self._compute_batchwise_differences(
-            features, features[start_points]
-        )  # --> #features x 10 matrix 연산. e.g., torch.Size([458640, 10])
-
-        approximate_coreset_anchor_distances = torch.mean(
-            approximate_distance_matrix, axis=-1
-        ).reshape(-1, 1)  # --> torch.Size([458640, 1])
+        if anchor_distances is not None:
+            approximate_coreset_anchor_distances = anchor_distances
+        else:
+            number_of_starting_points = np.clip(
+                self.number_of_starting_points, None, len(features)
+            )  # --> 10
+            start_points = np.random.RandomState(self.seed).choice(
+                len(features), number_of_starting_points, replace=False
+            ).tolist()  # --> 10 개 indices (seed 가 None 이면 매번 다름)
+
+            approximate_distance_matrix = self._compute_batchwise_differences(
+                features, features[start_points]
+            )  # --> #features x 10 matrix 연산. e.g., torch.Size([458640, 10])
+
+            approximate_coreset_anchor_distances = torch.mean(
+                approximate_distance_matrix, axis=-1
+            ).reshape(-1, 1)  # --> torch.Size([458640, 1])
         coreset_indices = []
 
         num_coreset_samples = int(len(features) * self.percentage)
@@ -1,8 +1,8 @@
 import torch
+import torch.nn.functional as F
 import torchvision.transforms as T
 from torch.utils.data import DataLoader, Dataset
 import numpy as np
-import onnxruntime
 import os
 import glob
 import shutil
@@ -11,19 +11,31 @@ from tqdm import tqdm
 import argparse
 import sys
 import json
+import copy
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))) # windows 배포 시, 같은 경로 파일 import 위해 필요
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE" # windows 배포 시, ONNX 와 FAISS 의 OpenMP 충돌 우회를 위해 필요
 
 # 필요하다면 함께 사용
-from common import get_memory_bank_manager
+from common import get_memory_bank_manager, FeatureBuffer, FEATURE_PRECISIONS
+from progress import report_progress
+from profiler import profile_stage, profiled
+from feature_cache import FeatureCache, FEATURE_CACHE_MAX_MB
+from onnx_session import BoundSession, create_session, detect_providers, select_model_path, model_signature
 
 # Default constants that will be updated with command-line args
 RESIZE_SIZE = 256
 ANOMALY_MAP_FOLDER = "anomaly_maps"
 MEMORY_BANK_FOLDER = "memory_dist"
+WORKER_FOLDER = "workers"  # 멀티프로세스 HPO 시 워커별 전용 작업 폴더
+WORKER_BEST_SUFFIX = "_best"  # 워커별 최고 trial 결과를 보관하는 폴더 접미사
+WORKER_BEST_RECORD = "trial.json"  # best 폴더에 함께 저장하는 trial 정보 (params, score 등)
 MODEL_PATH = "models/model.onnx"
 NUM_WORKERS = 0
+SCORE_BATCH_IMAGES = 64  # anomaly score 계산 시 한 번의 FAISS 검색에 모으는 이미지 수
+MASK_BATCH_IMAGES = 16  # 바이너리 마스크를 한 번에 업샘플링하는 최대 이미지 수 (원본 크기 메모리 제한)
+MASK_WRITER_THREADS = 4  # 마스크 PNG 저장 스레드 수 (NUM_THREADS 가 더 작으면 NUM_THREADS)
 TEST_RATIO = 0.2
 
 
@@ -37,6 +49,23 @@ USE_IMAGENET_NORM = True  # ImageNet 정규화 사용 플래그
 # 중앙 크롭 비율 (1.0 = 원본 크기 유지, 작을수록 더 많이 크롭)
 CENTER_CROP_RATE = 0.8
 
+# 프로세스당 CPU 스레드 수 (None 이면 각 라이브러리 기본값 사용), set_num_threads() 로 설정
+NUM_THREADS = None
+
+# 메모리 뱅크 특징 저장 정밀도 (fp32 / fp16 / sq8), set_feature_precision() 로 설정
+FEATURE_PRECISION = "fp32"
+
+# 백본 특징 디스크 캐시 (None 이면 사용 안 함), enable_feature_cache() 로 설정
+FEATURE_CACHE_FOLDER = "feature_cache"
+FEATURE_CACHE = None
+
+# quantize_model.py 로 만든 INT8 모델이 정확도 검증을 통과했으면 자동으로 사용, set_use_quantized_model() 로 설정
+USE_QUANTIZED_MODEL = True
+
+# 증분 메모리 뱅크의 base (key, MemoryBankManager), get_base_memory_bank() 가 프로세스마다 하나만 유지
+BASE_MEMORY_BANK = None
+BASE_MEMORY_BANK_SEED = 0
+
 # ----------------------------- 공통 유틸 ----------------------------- #
 
 def init_directories(*dirs):
@@ -50,6 +79,144 @@ def init_files(*files):
         if os.path.exists(file_path):
             os.remove(file_path)
 
+def get_worker_folder(root, worker_id=None):
+    """
+    워커 전용 작업 폴더 경로 반환
+    worker_id 가 None 이면 공유 위치(root) 를 그대로 사용
+    """
+    if worker_id is None:
+        return root
+    return os.path.join(root, WORKER_FOLDER, f"worker_{worker_id}")
+
+def set_num_threads(num_threads):
+    """
+    현재 프로세스의 CPU 스레드 수를 torch / FAISS / ONNX Runtime 에 공통으로 적용
+    여러 워커 프로세스가 동시에 실행될 때 코어를 나눠 쓰도록 워커 시작 시 호출
+    """
+    global NUM_THREADS
+    NUM_THREADS = max(1, int(num_threads))
+    torch.set_num_threads(NUM_THREADS)
+    # FAISS 는 MemoryBankManager 생성 시, ONNX Runtime 은 세션 생성 시 NUM_THREADS 를 사용
+    print(f"CPU 스레드 수 설정: {NUM_THREADS}")
+
+def set_feature_precision(precision):
+    """
+    메모리 뱅크의 coreset 이전 특징 버퍼와 FAISS 인덱스 정밀도 설정
+    fp16 / sq8 은 메모리와 대역폭을 절반 이하로 줄이는 대신 anomaly score 에 작은 오차가 생김
+    (bench_pipeline.py --precisions 로 오차 측정)
+    """
+    global FEATURE_PRECISION
+    if precision not in FEATURE_PRECISIONS:
+        raise ValueError(f"precision must be one of {FEATURE_PRECISIONS}, got {precision!r}")
+    FEATURE_PRECISION = precision
+    print(f"메모리 뱅크 정밀도 설정: {FEATURE_PRECISION}")
+
+def set_use_quantized_model(enabled):
+    """
+    False 이면 INT8 모델이 있어도 항상 원본 (FP32) 모델 사용
+    (INT8 모델 생성 / 정확도 검증은 quantize_model.py 참고)
+    """
+    global USE_QUANTIZED_MODEL
+    USE_QUANTIZED_MODEL = bool(enabled)
+
+def resolve_model_path(root):
+    """
+    root 아래 백본 모델 경로
+    USE_QUANTIZED_MODEL 이고 CPU 로 추론하는 경우 검증된 INT8 모델 우선 (GPU 에서는 INT8 이 빠르지 않음)
+    """
+    model_path = os.path.join(root, MODEL_PATH)
+    if USE_QUANTIZED_MODEL and detect_providers()[0] == "CPUExecutionProvider":
+        return select_model_path(model_path)
+    return model_path
+
+def evaluation_settings(root, incremental_memory_bank=False):
+    """
+    점수에 영향을 주는 현재 평가 설정 (trial 재현 시 비교 / 적용용)
+    feature_precision, incremental_memory_bank, INT8 모델 사용 여부, 실제 사용할 모델 파일의 (크기, 수정 시각)
+    """
+    model_path = resolve_model_path(root)
+    return {
+        "feature_precision": FEATURE_PRECISION,
+        "incremental_memory_bank": bool(incremental_memory_bank),
+        "quantized_model": model_path != os.path.join(root, MODEL_PATH),
+        "model": model_signature(model_path) if os.path.exists(model_path) else None,
+    }
+
+def enable_feature_cache(root, model_path=None, max_mb=FEATURE_CACHE_MAX_MB):
+    """
+    root/feature_cache 에 백본 특징 캐시 사용 (모델 파일 해시별로 구분)
+    변환(ColorJitter) 이 없는 이미지의 특징만 캐시되며, 이미지 파일이나 전처리 설정이 바뀌면 다시 계산
+    """
+    global FEATURE_CACHE
+    FEATURE_CACHE = FeatureCache(os.path.join(root, FEATURE_CACHE_FOLDER),
+                                 model_path or resolve_model_path(root), max_mb,
+                                 preprocess=(CENTER_CROP_RATE, RESIZE_SIZE))
+    print(f"특징 캐시 사용: {FEATURE_CACHE.folder} (최대 {max_mb}MB)")
+    return FEATURE_CACHE
+
+def keep_worker_best(root, worker_id, trial_record):
+    """
+    워커 작업 폴더의 현재 결과(메모리 뱅크, anomaly map)를 best 폴더로 보관
+    복사 대신 폴더 이름만 바꾸므로 비용이 거의 없음 (다음 trial 은 작업 폴더를 새로 생성)
+    """
+    work_folder = get_worker_folder(root, worker_id)
+    best_folder = work_folder + WORKER_BEST_SUFFIX
+    if os.path.exists(best_folder):
+        shutil.rmtree(best_folder)
+    os.replace(work_folder, best_folder)
+    with open(os.path.join(best_folder, WORKER_BEST_RECORD), 'w', encoding='utf-8') as f:
+        json.dump(trial_record, f)
+    return best_folder
+
+def find_worker_best(root, params, study_id=None, trial_id=None):
+    """
+    워커 best 폴더 중 params 가 일치하는 것을 찾아 (폴더, trial 정보) 반환, 없으면 (None, None)
+    study_id / trial_id 가 주어지면 그 값까지 일치해야 함 (다른 study 나 같은 params 의 다른 trial 결과 재사용 방지)
+    """
+    pattern = os.path.join(root, WORKER_FOLDER, f"*{WORKER_BEST_SUFFIX}", WORKER_BEST_RECORD)
+    for record_path in glob.glob(pattern):
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if record.get("params") != params:
+            continue
+        if study_id is not None and record.get("study_id") != study_id:
+            continue
+        if trial_id is not None and record.get("trial_id") != trial_id:
+            continue
+        return os.path.dirname(record_path), record
+    return None, None
+
+def promote_worker_best(best_folder, root, line_a_path, line_b_path):
+    """
+    워커 best 폴더의 결과를 공유 위치(root/memory_dist, root/anomaly_maps, 라인별 *_anomaly_maps)로 이동
+    A.init_paths 의 worker_id=None / worker_id 지정 시 경로 규칙과 대응됨
+    """
+    targets = [
+        (ANOMALY_MAP_FOLDER, os.path.join(root, ANOMALY_MAP_FOLDER)),
+        (MEMORY_BANK_FOLDER, os.path.join(root, MEMORY_BANK_FOLDER)),
+        (f"line_a{SAVE_DETAILS}", f"{line_a_path.rstrip('/')}{SAVE_DETAILS}"),
+        (f"line_b{SAVE_DETAILS}", f"{line_b_path.rstrip('/')}{SAVE_DETAILS}"),
+    ]
+    for name, dst in targets:
+        src = os.path.join(best_folder, name)
+        if not os.path.exists(src):
+            continue
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        shutil.move(src, dst)
+
+def derive_seed(seed, *keys):
+    """
+    trial seed 와 key 들로부터 결정적인 하위 seed 생성 (seed 가 None 이면 None)
+    같은 (seed, keys) 는 플랫폼/실행 순서와 무관하게 항상 같은 값을 반환
+    """
+    if seed is None:
+        return None
+    return int(np.random.SeedSequence([int(seed), *keys]).generate_state(1)[0])
+
 def get_image_paths(folder_path):
     image_paths = []
     for ext in ["png", "jpg", "jpeg", "bmp", "tif", "tiff"]:
@@ -57,21 +224,6 @@ def get_image_paths(folder_path):
     image_paths.sort()
     return image_paths
 
-def report_progress(progress, status="processing"):
-    """
-    진행 상황을 Electron에 보고하는 함수
-    
-    매개변수:
-        progress: 0에서 100 사이의 진행률 
-        status: 현재 처리 상태 메시지
-    """
-    # JSON 형식으로 진행 상황 보고
-    progress_data = {
-        "progress": round(progress, 2),
-        "status": status
-    }
-    print(json.dumps(progress_data), flush=True)
-
 def calculate_image_statistics(folder_path):
     """폴더 내 모든 이미지를 256×256으로 리사이즈한 뒤 채널 단위 mean / std 계산"""
     dataset = TransformedDataset(folder_path, transform=None, resize=True)
@@ -136,12 +288,14 @@ class TransformedDataset(Dataset):
             
             # Apply limit after splitting if specified
             if limit is not None and len(self.image_paths) > limit:
-                np.random.seed(seed)
-                self.image_paths = np.random.choice(self.image_paths, limit, replace=False).tolist()
+                # 전역 RNG 를 건드리지 않도록 별도 RandomState 사용 (np.random.seed 와 같은 선택 결과)
+                self.image_paths = np.random.RandomState(seed).choice(self.image_paths, limit, replace=False).tolist()
                 # 무작위 선택 후에도 정렬 유지
                 self.image_paths.sort()
 
         self.transform = transform
+        self.original_sizes = {}  # 이미지 경로 -> 원본 (width, height), 마스크 저장 시 재사용
+        self.transform_seed = None  # transform 의 랜덤 선택을 고정할 seed (None 이면 전역 RNG 사용)
         self.resize = T.Resize((RESIZE_SIZE, RESIZE_SIZE)) if resize else None
         self.mean, self.std = mean, std
 
@@ -150,60 +304,137 @@ class TransformedDataset(Dataset):
 
     def __getitem__(self, idx):
         img_path = self.image_paths[idx]
-        img = Image.open(img_path).convert("RGB")
-
-        # 중앙 크롭 적용
-        width, height = img.size
-        new_width = int(width * CENTER_CROP_RATE)
-        new_height = int(height * CENTER_CROP_RATE)
-        img = img.crop((
-            (width - new_width) // 2,
-            (height - new_height) // 2,
-            (width + new_width) // 2,
-            (height + new_height) // 2
-        ))
+        with profile_stage("decode"):
+            img = Image.open(img_path).convert("RGB")
+
+            # 중앙 크롭 적용
+            width, height = img.size
+            self.original_sizes[img_path] = (width, height)
+            new_width = int(width * CENTER_CROP_RATE)
+            new_height = int(height * CENTER_CROP_RATE)
+            img = img.crop((
+                (width - new_width) // 2,
+                (height - new_height) // 2,
+                (width + new_width) // 2,
+                (height + new_height) // 2
+            ))
 
         if self.transform:
-            img = self.transform(img)
+            with profile_stage("jitter"):
+                if self.transform_seed is None:
+                    img = self.transform(img)
+                else:
+                    # 이미지마다 고정된 seed 로 변환하여 순서와 무관하게 같은 결과가 나오도록 함
+                    with torch.random.fork_rng(devices=[]):
+                        torch.manual_seed(derive_seed(self.transform_seed, idx))
+                        img = self.transform(img)
         
-        # T.ToTensor() 사용하지 않고 차원 순서 유지
-        if self.resize:
-            img = self.resize(img)
-            
-        # PIL 이미지를 numpy 배열로 변환 (H, W, C) 형식 유지
-        img_np = np.array(img)
-        
-        # numpy 배열을 torch 텐서로 변환 (H, W, C) 형식 유지
-        img_tensor = torch.from_numpy(img_np).float()
+        with profile_stage("resize"):
+            # T.ToTensor() 사용하지 않고 차원 순서 유지
+            if self.resize:
+                img = self.resize(img)
+
+            # PIL 이미지를 numpy 배열로 변환 (H, W, C) 형식 유지
+            img_np = np.array(img)
+
+            # numpy 배열을 torch 텐서로 변환 (H, W, C) 형식 유지
+            img_tensor = torch.from_numpy(img_np).float()
 
         return img_tensor, img_path
 
-    def update_transform(self, new_transform):
-        """Transform을 업데이트하는 메서드"""
+    def original_size(self, img_path):
+        """원본 이미지 (width, height), __getitem__ 에서 기록되지 않았으면 헤더만 읽어서 확인"""
+        size = self.original_sizes.get(img_path)
+        if size is None:
+            with Image.open(img_path) as img:
+                size = img.size
+            self.original_sizes[img_path] = size
+        return size
+
+    def update_transform(self, new_transform, seed=None):
+        """Transform을 업데이트하는 메서드 (seed 를 주면 이미지별 랜덤 변환이 재현 가능)"""
         self.transform = new_transform
+        self.transform_seed = seed
         return self
 
+def make_color_dataloaders(dataset, color_tf, num_passes, seed=None):
+    """
+    같은 이미지에 ColorJitter 를 num_passes 번 적용하는 데이터로더 리스트 생성
+    seed 가 주어지면 pass 마다 다른, 그러나 재현 가능한 seed 를 사용
+    """
+    dataloaders = []
+    for pass_idx in range(num_passes):
+        ds = copy.copy(dataset).update_transform(color_tf, seed=derive_seed(seed, pass_idx))
+        dataloaders.append(DataLoader(ds, batch_size=1, shuffle=False, num_workers=NUM_WORKERS))
+    return dataloaders
+
 # -------------------------- ONNX 모델 관련 --------------------------- #
 
+# 프로세스별 ONNX 세션 캐시: trial 마다 A 를 새로 만들어도 세션은 한 번만 생성
+_onnx_sessions = {}
+
 def load_onnx_model(model_path):
-    """ONNX 모델을 GPU로 로드"""
-    onnx_model = onnxruntime.InferenceSession(
-        model_path,
-        providers=['CUDAExecutionProvider']
-        #providers=['CPUExecutionProvider']
-    )
+    """
+    ONNX 모델을 사용 가능한 provider (CUDA 가 없으면 CPU) 로 로드 (같은 프로세스에서는 생성된 세션 재사용)
+    provider 선택 / SessionOptions / 최적화 모델 캐시는 onnx_session.create_session 참고
+    """
+    providers = detect_providers()
+    cache_key = (os.path.abspath(model_path), NUM_THREADS, tuple(providers))
+    if cache_key in _onnx_sessions:
+        return _onnx_sessions[cache_key]
+
+    # 반복 추론 시 입력 / 출력 버퍼를 재사용하도록 IOBinding wrapper 로 감쌈
+    onnx_model = BoundSession(create_session(model_path, num_threads=NUM_THREADS, providers=providers))
+    _onnx_sessions[cache_key] = onnx_model
     return onnx_model
 
-def get_patch_features(model, img_tensor):
-    """ONNX 모델을 사용하여 특징을 추출"""
-    # ONNX 모델은 numpy 입력을 받으므로 변환
-    input_name = model.get_inputs()[0].name
-    ort_inputs = {input_name: img_tensor.numpy().astype(np.float32)}
-    ort_outputs = model.run(None, ort_inputs)
-    features = ort_outputs[0]  # 첫 번째 출력을 사용
+def get_patch_features(model, img_tensor, img_path=None, reuse_output=False):
+    """
+    ONNX 모델을 사용하여 특징을 추출
+    img_path 가 주어지고 특징 캐시가 켜져 있으면 캐시를 먼저 확인하고, 추론 결과는 캐시에 추가
+    reuse_output=True 이면 BoundSession 의 재사용 출력 버퍼를 그대로 반환
+    (다음 호출에서 덮어쓰므로 버퍼 등에 바로 복사하는 호출자만 사용)
+    """
+    if img_path is not None and FEATURE_CACHE is not None:
+        with profile_stage("feature_cache"):
+            features = FEATURE_CACHE.get(img_path)
+        if features is not None:
+            return features
+
+    # ONNX 모델은 numpy 입력을 받으므로 변환 (float32 tensor 이면 복사 없이 메모리 공유)
+    inputs = np.ascontiguousarray(img_tensor.numpy(), dtype=np.float32)
+    with profile_stage("onnx_inference"):
+        if isinstance(model, BoundSession):
+            features = model.run_bound(inputs, reuse_output=reuse_output)
+        else:
+            features = model.run(None, {model.get_inputs()[0].name: inputs})[0]  # 첫 번째 출력을 사용
+
+    if img_path is not None and FEATURE_CACHE is not None:
+        with profile_stage("feature_cache"):
+            FEATURE_CACHE.put(img_path, features)
     return features
 
-def create_memory_bank(folder_paths, model, dataloaders, memory_bank_folder=MEMORY_BANK_FOLDER):
+def flush_feature_cache():
+    """데이터로더 한 바퀴가 끝날 때 특징 캐시를 디스크에 기록 (put 마다 기록하지 않음)"""
+    if FEATURE_CACHE is not None:
+        with profile_stage("feature_cache"):
+            FEATURE_CACHE.flush()
+
+def cacheable_path(dataloader, img_paths):
+    """변환 없이 한 장씩 읽는 데이터로더이면 특징 캐시 key 로 쓸 이미지 경로, 아니면 None"""
+    if FEATURE_CACHE is None or len(img_paths) != 1 or getattr(dataloader.dataset, "transform", None) is not None:
+        return None
+    return img_paths[0]
+
+def create_memory_bank(folder_paths, model, dataloaders, memory_bank_folder=MEMORY_BANK_FOLDER, seed=None,
+                       persist=True, precision=None, base=None, ratio_images=None):
+    """
+    precision 이 None 이면 FEATURE_PRECISION 사용 (fp16 / sq8 이면 특징 버퍼를 float16 으로 보관)
+    persist=False 이면 메모리 뱅크를 디스크에 저장하지 않고 메모리에만 유지
+    (필요할 때 mb_mgr.save(folder, mb_mgr.patch_shape) 또는 A.save_memory_bank() 로 저장)
+    base 가 주어지면 base 메모리 뱅크에 dataloaders 의 특징만 이어서 추가 (get_base_memory_bank 참고)
+    ratio_images: coreset_ratio 계산에 사용할 총 이미지 수 (None 이면 dataloaders 의 이미지 수)
+    """
     print("\n[메모리 뱅크 생성 중]")
     report_progress(0, "메모리 뱅크 생성 중")
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -213,8 +444,8 @@ def create_memory_bank(folder_paths, model, dataloaders, memory_bank_folder=MEMO
     # 이미지당 패치 수 (32x32)
     patches_per_image = 32 * 32
     
-    # 총 패치 수 계산
-    total_patches = total_images * patches_per_image
+    # 총 패치 수 계산 (base 와 나눠서 만들 때도 전체 기준으로 같은 비율 사용)
+    total_patches = (ratio_images or total_images) * patches_per_image
     
     # 목표 subsampling 수 (10,000개)
     target_samples = 10000
@@ -228,79 +459,207 @@ def create_memory_bank(folder_paths, model, dataloaders, memory_bank_folder=MEMO
     else:
         print("경고: 데이터셋이 비어 있습니다. 기본 coreset_ratio를 사용합니다.")
 
-    mb_mgr = get_memory_bank_manager(coreset_ratio, device)
+    if base is not None:
+        precision = base.precision
+    mb_mgr = get_memory_bank_manager(coreset_ratio, device, NUM_THREADS, seed=derive_seed(seed, 0xC0DE),
+                                     precision=precision or FEATURE_PRECISION)
 
-    features_all = []
+    # 이미지 수 x 이미지당 패치 수 만큼 미리 할당한 버퍼에 바로 채움
+    feature_buffer = mb_mgr.create_feature_buffer(total_images * patches_per_image)
+    rows_per_image = None
     
     # 진행률 계산을 위한 변수
     processed_images = 0
     
     for path_idx, (path, dl) in enumerate(zip(folder_paths, dataloaders)):
-        for batch_idx, (imgs, _) in enumerate(tqdm(dl, desc=f"> {path}")):
-            feats = get_patch_features(model, imgs)
-            features_all.append(feats)
+        for batch_idx, (imgs, img_paths) in enumerate(tqdm(dl, desc=f"> {path}")):
+            feats = get_patch_features(model, imgs, cacheable_path(dl, img_paths), reuse_output=True)
+            feature_buffer.append(feats)
+            rows_per_image = len(feats) // len(imgs)
             
             # 진행률 업데이트 (메모리 뱅크 생성은 전체 과정의 0-50% 차지)
             processed_images += 1
             progress = (processed_images / total_images) * 50
             report_progress(progress, "메모리 뱅크 생성 중")
 
-    mb_mgr.fill_memory_bank(features_all)
+    flush_feature_cache()
+    mb_mgr.fill_memory_bank(feature_buffer, base=base)
+    del feature_buffer
 
     # Patch shape 추론 & 저장
-    feat_side = int(np.sqrt(features_all[0].shape[0]))
-    mb_mgr.save(memory_bank_folder, [[feat_side, feat_side]])
-    print(f"메모리 뱅크 저장 완료: {memory_bank_folder}")
+    feat_side = int(np.sqrt(rows_per_image))
+    mb_mgr.patch_shape = [[feat_side, feat_side]]
+    if persist:
+        with profile_stage("memory_bank_save"):
+            mb_mgr.save(memory_bank_folder, mb_mgr.patch_shape)
+        print(f"메모리 뱅크 저장 완료: {memory_bank_folder}")
     report_progress(50, "메모리 뱅크 생성 완료")
     return mb_mgr
 
+def get_base_memory_bank(folder_path, model, model_path, dataloader, ratio_images, precision=None):
+    """
+    증분 메모리 뱅크의 base (변환 없는 A_TRAIN 만의 coreset + FAISS 인덱스)
+    프로세스 안에서 한 번만 만들고, 같은 모델 / 이미지 / 비율 / 정밀도이면 이후 trial 에서 재사용
+    trial seed 와 무관하게 BASE_MEMORY_BANK_SEED 로 만들어 어떤 trial 이 먼저 실행되어도 결과가 같음
+    """
+    global BASE_MEMORY_BANK
+    precision = precision or FEATURE_PRECISION
+    key = (os.path.abspath(model_path), tuple(dataloader.dataset.image_paths), ratio_images, precision,
+           CENTER_CROP_RATE, RESIZE_SIZE)
+    if BASE_MEMORY_BANK is not None and BASE_MEMORY_BANK[0] == key:
+        print("[base 메모리 뱅크 재사용]")
+        return BASE_MEMORY_BANK[1]
+    BASE_MEMORY_BANK = None  # 새 base 를 만드는 동안 이전 base 를 들고 있지 않도록 먼저 해제
+    base = create_memory_bank([folder_path], model, [dataloader], seed=BASE_MEMORY_BANK_SEED, persist=False,
+                              precision=precision, ratio_images=ratio_images)
+    BASE_MEMORY_BANK = (key, base)
+    return base
+
 def compute_top_anomaly_scores(dataloader, mb_mgr, model, top_percent=0.1):
-    scores = []
-    for imgs, paths in tqdm(dataloader, desc="[Anomaly Score]"):
-        anom_map, _ = compute_anomaly_map(imgs, mb_mgr, model)
-        flat = anom_map.flatten()
-        k    = int(len(flat) * top_percent)
-        topk = np.partition(flat, -k)[-k:]
-        scores.append({"image_path": paths[0], "top_mean_score": float(np.mean(topk))})
+    anomaly_maps, paths = compute_anomaly_maps(dataloader, mb_mgr, model, desc="[Anomaly Score]")
+    top_means = top_mean_scores(anomaly_maps, top_percent)
+    return [{"image_path": path, "top_mean_score": float(score)} for path, score in zip(paths, top_means)]
+
+def top_mean_scores(anomaly_maps, top_percent):
+    """[N x H x W] anomaly map 들의 이미지별 상위 top_percent 패치 평균 (벡터화)"""
+    flat = anomaly_maps.reshape(len(anomaly_maps), -1)
+    k = int(flat.shape[1] * top_percent)
+    return np.partition(flat, -k, axis=1)[:, -k:].mean(axis=1)
+
+def compute_anomaly_maps(dataloader, mb_mgr, model, batch_images=SCORE_BATCH_IMAGES, desc="[Anomaly Maps]",
+                         progress_range=None, status="Anomaly Maps 생성 중"):
+    """
+    데이터로더의 모든 이미지에 대한 anomaly map 계산
+    특징 추출은 이미지마다, FAISS 검색은 batch_images 장의 패치를 모아 한 번에 수행
+
+    매개변수:
+        progress_range: (시작, 끝) 진행률 구간이 주어지면 이미지마다 진행 상황 보고
 
-    return scores
+    반환:
+        ([N x 32 x 32] anomaly map 배열, 이미지 경로 리스트)
+    """
+    total = len(dataloader.dataset)
+    anomaly_maps, paths = [], []
+    # 검색 전까지 특징을 모아 두는 버퍼 (추론 출력 버퍼에서 바로 복사, 검색 후 비우고 재사용)
+    pending = FeatureBuffer(batch_images * 32 * 32)
+    pending_images = 0
+
+    def flush():
+        nonlocal pending_images
+        if pending_images:
+            with profile_stage("faiss_search"):
+                anomaly_maps.append(mb_mgr.predict_batch(pending.view(), [[32, 32]]))
+            pending.clear()
+            pending_images = 0
+
+    for idx, (imgs, img_paths) in enumerate(tqdm(dataloader, desc=desc)):
+        pending.append(get_patch_features(model, imgs, cacheable_path(dataloader, img_paths), reuse_output=True))
+        pending_images += len(imgs)
+        paths.extend(img_paths)
+        if pending_images >= batch_images:
+            flush()
+        if progress_range is not None:
+            start, end = progress_range
+            report_progress(start + ((idx + 1) / total) * (end - start), status)
+    flush()
+    flush_feature_cache()
+
+    if not anomaly_maps:
+        return np.zeros((0, 32, 32), dtype=np.float32), paths
+    return np.concatenate(anomaly_maps, axis=0), paths
 
 def compute_anomaly_map(img_tensor, mb_mgr, model, reshape=True):
     feats = get_patch_features(model, img_tensor)
-    if reshape:
-        scores = mb_mgr.predict(feats, [[32, 32]]).squeeze(0) # 내부 *(self.patch_shape[0]) 에 대응하기 위함
-    else:
-        scores = mb_mgr.predict_no_reshape(feats)
+    with profile_stage("faiss_search"):
+        if reshape:
+            scores = mb_mgr.predict(feats, [[32, 32]]).squeeze(0) # 내부 *(self.patch_shape[0]) 에 대응하기 위함
+        else:
+            scores = mb_mgr.predict_no_reshape(feats)
     return scores, feats
 
+def upsample_binary_masks(anomaly_maps, original_size, threshold):
+    """
+    같은 원본 크기의 [N x h x w] anomaly map 들을 한 번에 바이너리 마스크 [N x H x W] 로 변환
+    중앙 크롭 영역 크기로 bilinear 업샘플링 -> threshold 이상이면 255 -> 원본 크기로 패딩
+    """
+    orig_width, orig_height = original_size
+    # CENTER_CROP_RATE가 0.8이므로, anomaly map은 원본의 80% 크기에 해당
+    cropped_width = int(orig_width * CENTER_CROP_RATE)
+    cropped_height = int(orig_height * CENTER_CROP_RATE)
+
+    maps = torch.from_numpy(np.ascontiguousarray(anomaly_maps, dtype=np.float32)).unsqueeze(1)
+    resized = F.interpolate(maps, size=(cropped_height, cropped_width), mode="bilinear", align_corners=False)
+
+    # 크롭된 영역을 원본 이미지 중앙에 배치 (가장자리는 0 패딩)
+    masks = np.zeros((len(anomaly_maps), orig_height, orig_width), dtype=np.uint8)
+    start_x = (orig_width - cropped_width) // 2
+    start_y = (orig_height - cropped_height) // 2
+    masks[:, start_y:start_y + cropped_height, start_x:start_x + cropped_width] = \
+        (resized.squeeze(1) >= float(threshold)).numpy().astype(np.uint8) * 255
+    return masks
+
+class MaskWriter:
+    """
+    anomaly map 을 원본 크기 바이너리 마스크 PNG 로 저장
+    - 원본 크기는 데이터셋에 기록된 값을 사용 (이미지를 다시 열지 않음)
+    - 원본 크기가 같은 map 들을 묶어 torch interpolate 로 한 번에 업샘플링
+    - PNG 인코딩 / 저장은 스레드 풀에서 진행되어 이후 scoring 과 겹쳐서 실행, close() 에서 완료 대기
+    """
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = min(MASK_WRITER_THREADS, NUM_THREADS or MASK_WRITER_THREADS)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @staticmethod
+    def _save(mask, save_path):
+        Image.fromarray(mask).save(save_path)
+
+    def write(self, anomaly_maps, paths, dataset, threshold, save_dir):
+        """anomaly_maps[i] 를 save_dir/basename(paths[i]) 로 저장 요청"""
+        groups = {}
+        for i, img_path in enumerate(paths):
+            groups.setdefault(dataset.original_size(img_path), []).append(i)
+
+        for original_size, indices in groups.items():
+            for start in range(0, len(indices), MASK_BATCH_IMAGES):
+                chunk = indices[start:start + MASK_BATCH_IMAGES]
+                with profile_stage("mask_upsample"):
+                    masks = upsample_binary_masks(anomaly_maps[chunk], original_size, threshold)
+                for mask, i in zip(masks, chunk):
+                    save_path = os.path.join(save_dir, os.path.basename(paths[i]))
+                    self.futures.append(self.executor.submit(self._save, mask, save_path))
+
+    def close(self):
+        """저장 요청이 모두 끝날 때까지 대기 (저장 중 발생한 예외는 다시 발생)"""
+        with profile_stage("png_write"):
+            try:
+                for future in self.futures:
+                    future.result()
+            finally:
+                self.futures = []
+                self.executor.shutdown(wait=True)
+
 # ------------------------------- Class A ----------------------------- #
 
 class A:
-    def __init__(self, root="", line_a_path="", line_b_path="", gap=0.0):
-        # 경로 설정
-        self.root = root
-        self.line_a_path = line_a_path
-        self.line_b_path = line_b_path
+    def __init__(self, root="", line_a_path="", line_b_path="", gap=0.0, worker_id=None):
         self.gap = gap  # GAP 값을 인스턴스 변수로 저장
 
-        # 폴더 및 모델 경로 설정
-        self.anomaly_map_folder = os.path.join(root, ANOMALY_MAP_FOLDER)
-        self.memory_bank_folder = os.path.join(root, MEMORY_BANK_FOLDER)
-        self.model_path = os.path.join(root, MODEL_PATH)
-
-
-        # 라인별 anomaly_map 저장 디렉토리 생성
-        # 경로 끝의 슬래시 제거 후 SAVE_DETAILS 추가
-        a_test_anomaly_dir = f"{self.line_a_path.rstrip('/')}{SAVE_DETAILS}"
-        b_test_anomaly_dir = f"{self.line_b_path.rstrip('/')}{SAVE_DETAILS}"
-        self.a_test_anomaly_dir = a_test_anomaly_dir
-        self.b_test_anomaly_dir = b_test_anomaly_dir
+        # 경로 설정
+        self.init_paths(root, line_a_path, line_b_path, worker_id)
 
         # 디렉토리 초기화
-        init_directories(self.anomaly_map_folder, self.memory_bank_folder, a_test_anomaly_dir, b_test_anomaly_dir)
+        init_directories(self.anomaly_map_folder, self.memory_bank_folder, self.a_test_anomaly_dir, self.b_test_anomaly_dir)
 
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = load_onnx_model(self.model_path)
+        self.init_model_state()
 
         # ONNX 모델은 이미 정규화가 포함되어 있으므로 0-1 범위로만 변환 (정규화 생략)
         print("ONNX 모델은 이미 ImageNet 정규화가 포함되어 있어 추가 정규화를 생략합니다.")
@@ -364,8 +723,74 @@ class A:
             selected_paths=self.ds_a_training.image_paths.copy()  # 동일한 이미지 사용
         )
 
+    def init_model_state(self):
+        """모델 로드와 trial 간 상태 초기화 (init_paths 이후 호출, 하위 클래스와 공유)"""
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = load_onnx_model(self.model_path)
+        self.mb_mgr = None  # 마지막 func 호출에서 생성한 메모리 뱅크
+        self.last_anomaly_maps = None  # write_masks=False 로 평가한 마지막 trial 의 anomaly map (나중에 마스크 생성용)
+
+    def init_paths(self, root, line_a_path, line_b_path, worker_id=None):
+        """
+        메모리 뱅크 / anomaly map 폴더 경로 설정
+        worker_id 가 주어지면 다른 워커와 겹치지 않도록 워커 전용 폴더 아래에 생성
+        """
+        self.root = root
+        self.line_a_path = line_a_path
+        self.line_b_path = line_b_path
+        self.worker_id = worker_id
+
+        # 폴더 및 모델 경로 설정
+        work_folder = get_worker_folder(root, worker_id)
+        self.anomaly_map_folder = os.path.join(work_folder, ANOMALY_MAP_FOLDER)
+        self.memory_bank_folder = os.path.join(work_folder, MEMORY_BANK_FOLDER)
+        self.model_path = resolve_model_path(root)
+        if self.model_path != os.path.join(root, MODEL_PATH):
+            print(f"INT8 양자화 모델 사용: {self.model_path}")
+
+        # 라인별 anomaly_map 저장 디렉토리
+        if worker_id is None:
+            # 경로 끝의 슬래시 제거 후 SAVE_DETAILS 추가
+            self.a_test_anomaly_dir = f"{line_a_path.rstrip('/')}{SAVE_DETAILS}"
+            self.b_test_anomaly_dir = f"{line_b_path.rstrip('/')}{SAVE_DETAILS}"
+        else:
+            self.a_test_anomaly_dir = os.path.join(work_folder, f"line_a{SAVE_DETAILS}")
+            self.b_test_anomaly_dir = os.path.join(work_folder, f"line_b{SAVE_DETAILS}")
+
+    def save_memory_bank(self, folder=None):
+        """
+        마지막 func 호출의 메모리 뱅크를 디스크에 저장 (기본: self.memory_bank_folder)
+        save_memory_bank=False 로 평가한 trial 중 best trial 만 남기거나 내보낼 때 사용
+        """
+        if self.mb_mgr is None:
+            raise RuntimeError("저장할 메모리 뱅크가 없습니다. func() 를 먼저 호출하세요.")
+        folder = folder or self.memory_bank_folder
+        os.makedirs(folder, exist_ok=True)
+        with profile_stage("memory_bank_save"):
+            self.mb_mgr.save(folder, self.mb_mgr.patch_shape)
+        print(f"메모리 뱅크 저장 완료: {folder}")
+        return folder
+
+    def write_masks(self):
+        """
+        write_masks=False 로 평가한 마지막 trial 의 바이너리 마스크를 *_anomaly_maps 폴더에 생성
+        (best 파라미터 / 선택한 trial 에 대해서만 마스크가 필요할 때 사용)
+        """
+        if self.last_anomaly_maps is None:
+            raise RuntimeError("마스크를 만들 anomaly map 이 없습니다. func(write_masks=False) 를 먼저 호출하세요.")
+        threshold = self.last_anomaly_maps["threshold"]
+        with MaskWriter() as mask_writer:
+            for dataset, save_dir, key in ((self.ds_a_test, self.a_test_anomaly_dir, "a_test"),
+                                           (self.ds_b_test, self.b_test_anomaly_dir, "b_test")):
+                os.makedirs(save_dir, exist_ok=True)
+                maps, paths = self.last_anomaly_maps[key]
+                mask_writer.write(maps, paths, dataset, threshold, save_dir)
+        print(f"바이너리 마스크 저장 완료: {self.a_test_anomaly_dir}, {self.b_test_anomaly_dir}")
+
     # --------------------------- 핵심 함수 --------------------------- #
-    def func(self, brightness: float = 0.0, contrast: float = 0.0, saturation: float = 0.0, hue: float = 0.0) -> float:
+    @profiled
+    def func(self, brightness: float = 0.0, contrast: float = 0.0, saturation: float = 0.0, hue: float = 0.0,
+             seed: int = None, save_memory_bank: bool = True, write_masks: bool = True) -> float:
         """
         1) A_TRAIN_COLOR 생성: A_TRAIN 각 이미지에 ColorJitter 파라미터 내에서 랜덤한 색상 변환 적용
         2) A_TRAIN + A_TRAIN_COLOR 로 메모리 뱅크 생성
@@ -376,6 +801,10 @@ class A:
             contrast: 대비 변화 최대 강도 (0: 변화 없음, 값이 클수록 더 큰 변화 가능성)
             saturation: 채도 변화 최대 강도 (0: 변화 없음, 값이 클수록 더 큰 변화 가능성)
             hue: 색조 변화 최대 강도 (0: 변화 없음, 값이 클수록 더 큰 변화 가능성)
+            seed: ColorJitter 와 coreset 샘플링의 랜덤 선택을 고정하는 trial seed (None 이면 매번 다름)
+            save_memory_bank: False 이면 메모리 뱅크를 디스크에 쓰지 않음 (필요 시 save_memory_bank() 로 저장)
+            write_masks: False 이면 점수만 계산하고 바이너리 마스크는 만들지 않음 (필요 시 write_masks() 로 생성)
+            profile: True 이면 단계별 소요 시간 / 메모리 기록을 self.last_profile 에 저장
 
         HPO 파라미터 범위 추천:
         - brightness: 0.0 ~ 0.5
@@ -416,132 +845,65 @@ class A:
                 self.model,
                 [dl_a_training],
                 memory_bank_folder=self.memory_bank_folder,
+                seed=seed,
+                persist=save_memory_bank,
             )
         else:
-            # A_COLOR transform 업데이트 (init에서 생성된 데이터셋 재사용)
+            # A_COLOR transform 적용 (init에서 생성된 데이터셋 재사용, pass 마다 다른 seed)
             color_tf = T.ColorJitter(brightness=brightness, contrast=contrast, saturation=saturation, hue=hue)
-            self.ds_a_color.update_transform(color_tf)
-            dl_a_color = DataLoader(self.ds_a_color, batch_size=1, shuffle=False, num_workers=NUM_WORKERS)
+            dl_a_colors = make_color_dataloaders(self.ds_a_color, color_tf, 3, seed=seed)
             
             mb_mgr = create_memory_bank(
                 [self.line_a_path, f"{self.line_a_path}_COLOR1", f"{self.line_a_path}_COLOR2", f"{self.line_a_path}_COLOR3"],
                 self.model,
-                [dl_a_training, dl_a_color, dl_a_color, dl_a_color],
+                [dl_a_training, *dl_a_colors],
                 memory_bank_folder=self.memory_bank_folder,
+                seed=seed,
+                persist=save_memory_bank,
             )
 
-        # --- A_TEST에 대한 anomaly map 및 점수 계산 --- #
-        a_test_anomaly_maps = []
-        a_test_scores = []
-        
+        self.mb_mgr = mb_mgr
+
+        # --- A_TEST에 대한 anomaly map 및 점수 계산 (A_TEST는 50-75% 구간) --- #
         report_progress(50, "Anomaly Maps 생성 중")
-        total_a_test = len(dl_a_test.dataset)
-        
-        for idx, (imgs, paths) in enumerate(tqdm(dl_a_test, desc="[A_TEST Anomaly Maps]")):
-            anom_map, _ = compute_anomaly_map(imgs, mb_mgr, self.model)
-            a_test_anomaly_maps.append((anom_map, paths[0]))
-            a_test_scores.append(np.max(anom_map))
-            
-            # 진행률 업데이트 (A_TEST는 50-75% 구간)
-            progress = 50 + ((idx + 1) / total_a_test) * 25
-            report_progress(progress, "Anomaly Maps 생성 중")
+        a_test_maps, a_test_paths = compute_anomaly_maps(dl_a_test, mb_mgr, self.model, desc="[A_TEST Anomaly Maps]",
+                                                         progress_range=(50, 75))
+        a_test_scores = a_test_maps.reshape(len(a_test_maps), -1).max(axis=1)
         
         # A_TEST의 최대 anomaly score 계산
-        a_test_max_score = np.max(a_test_scores) if a_test_scores else 0.0
-        mean_score_a = float(np.mean(a_test_scores)) if a_test_scores else 0.0
+        a_test_max_score = np.max(a_test_scores) if len(a_test_scores) else 0.0
+        mean_score_a = float(np.mean(a_test_scores)) if len(a_test_scores) else 0.0
         print(f"A_TEST 최대 점수: {a_test_max_score}")
         print(f"A_TEST 평균 점수: {mean_score_a}")
         a_test_max_score = a_test_max_score + self.gap
         
 
-        # --- A_TEST anomaly map을 바이너리 마스크로 변환하여 저장 --- #
-        for anom_map, img_path in a_test_anomaly_maps:
-            # 원본 이미지 로드하여 크기 확인
-            original_img = Image.open(img_path)
-            orig_width, orig_height = original_img.size
-            
-            # anomaly map을 bilinear 보간법으로 crop된 영역 크기로 확대
-            # CENTER_CROP_RATE가 0.8이므로, anomaly map은 원본의 80% 크기에 해당
-            cropped_width = int(orig_width * CENTER_CROP_RATE)
-            cropped_height = int(orig_height * CENTER_CROP_RATE)
-            
-            anom_map_img = Image.fromarray(anom_map)
-            anom_map_img = anom_map_img.resize((cropped_width, cropped_height), Image.BILINEAR)
-            anom_map_resized = np.array(anom_map_img)
-            
-            # 보간된 anomaly map에 대해 바이너리 마스크 생성: max 값보다 낮으면 0, 높거나 같으면 1
-            binary_mask_cropped = (anom_map_resized >= a_test_max_score).astype(np.uint8) * 255
-            
-            # 패딩을 추가하여 원본 이미지 크기로 확장 (가장자리에 패딩 추가)
-            binary_mask = np.zeros((orig_height, orig_width), dtype=np.uint8)
-            
-            # 계산된 크롭 영역의 시작점
-            start_x = (orig_width - cropped_width) // 2
-            start_y = (orig_height - cropped_height) // 2
-            
-            # 크롭된 anomaly map을 원본 이미지 중앙에 배치
-            binary_mask[start_y:start_y+cropped_height, start_x:start_x+cropped_width] = binary_mask_cropped
-            
-            # 저장할 파일 경로 생성
-            filename = os.path.basename(img_path)
-            save_path = os.path.join(self.a_test_anomaly_dir, filename)
-            
-            # 바이너리 마스크 저장
-            Image.fromarray(binary_mask).save(save_path)
-        
-        # --- B_TEST에 대한 anomaly map 및 점수 계산 --- #
-        b_test_anomaly_maps = []
-        b_test_scores = []
+        # --- A_TEST anomaly map을 바이너리 마스크로 변환하여 저장 (저장은 B_TEST scoring 과 병행) --- #
+        mask_writer = MaskWriter() if write_masks else None
+        if mask_writer is not None:
+            mask_writer.write(a_test_maps, a_test_paths, self.ds_a_test, a_test_max_score, self.a_test_anomaly_dir)
         
+        # --- B_TEST에 대한 anomaly map 및 점수 계산 (B_TEST는 75-100% 구간) --- #
         report_progress(75, "Anomaly Maps 생성 중")
-        total_b_test = len(dl_b_test.dataset)
-        
-        for idx, (imgs, paths) in enumerate(tqdm(dl_b_test, desc="[B_TEST Anomaly Maps]")):
-            anom_map, _ = compute_anomaly_map(imgs, mb_mgr, self.model)
-            b_test_anomaly_maps.append((anom_map, paths[0]))
-            b_test_scores.append(np.max(anom_map))
-            
-            # 진행률 업데이트 (B_TEST는 75-100% 구간)
-            progress = 75 + ((idx + 1) / total_b_test) * 25
-            report_progress(progress, "Anomaly Maps 생성 중")
+        b_test_maps, b_test_paths = compute_anomaly_maps(dl_b_test, mb_mgr, self.model, desc="[B_TEST Anomaly Maps]",
+                                                         progress_range=(75, 100))
+        b_test_scores = b_test_maps.reshape(len(b_test_maps), -1).max(axis=1)
         
-        mean_score_b = float(np.mean(b_test_scores)) if b_test_scores else 0.0
+        mean_score_b = float(np.mean(b_test_scores)) if len(b_test_scores) else 0.0
         print(f"B_TEST 평균 점수: {mean_score_b}")
         
         # --- B_TEST anomaly map을 바이너리 마스크로 변환하여 저장 --- #
-        for anom_map, img_path in b_test_anomaly_maps:
-            # 원본 이미지 로드하여 크기 확인
-            original_img = Image.open(img_path)
-            orig_width, orig_height = original_img.size
-            
-            # anomaly map을 bilinear 보간법으로 crop된 영역 크기로 확대
-            # CENTER_CROP_RATE가 0.8이므로, anomaly map은 원본의 80% 크기에 해당
-            cropped_width = int(orig_width * CENTER_CROP_RATE)
-            cropped_height = int(orig_height * CENTER_CROP_RATE)
-            
-            anom_map_img = Image.fromarray(anom_map)
-            anom_map_img = anom_map_img.resize((cropped_width, cropped_height), Image.BILINEAR)
-            anom_map_resized = np.array(anom_map_img)
-            
-            # 보간된 anomaly map에 대해 바이너리 마스크 생성: max 값보다 낮으면 0, 높거나 같으면 1
-            binary_mask_cropped = (anom_map_resized >= a_test_max_score).astype(np.uint8) * 255
-            
-            # 패딩을 추가하여 원본 이미지 크기로 확장 (가장자리에 패딩 추가)
-            binary_mask = np.zeros((orig_height, orig_width), dtype=np.uint8)
-            
-            # 계산된 크롭 영역의 시작점
-            start_x = (orig_width - cropped_width) // 2
-            start_y = (orig_height - cropped_height) // 2
-            
-            # 크롭된 anomaly map을 원본 이미지 중앙에 배치
-            binary_mask[start_y:start_y+cropped_height, start_x:start_x+cropped_width] = binary_mask_cropped
-            
-            # 저장할 파일 경로 생성
-            filename = os.path.basename(img_path)
-            save_path = os.path.join(self.b_test_anomaly_dir, filename)
-            
-            # 바이너리 마스크 저장
-            Image.fromarray(binary_mask).save(save_path)
+        if mask_writer is not None:
+            mask_writer.write(b_test_maps, b_test_paths, self.ds_b_test, a_test_max_score, self.b_test_anomaly_dir)
+            mask_writer.close()
+            self.last_anomaly_maps = None
+        else:
+            # score-only: 마스크는 필요할 때 write_masks() 로 한 번만 생성
+            self.last_anomaly_maps = {
+                "a_test": (a_test_maps, a_test_paths),
+                "b_test": (b_test_maps, b_test_paths),
+                "threshold": a_test_max_score,
+            }
 
         # B_TEST와 A_TEST 간의 차이 반환
         score_diff = mean_score_b - mean_score_a
@@ -563,9 +925,24 @@ def main():
     parser.add_argument('--saturation', type=float, default=0, help='채도 변화 강도')
     parser.add_argument('--hue', type=float, default=0, help='색조 변화 강도')
     parser.add_argument('--gap', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None, help='재현용 trial seed (없으면 매번 다른 결과)')
+    parser.add_argument('--profile', action='store_true', help='단계별 소요 시간 / 메모리 기록 출력')
+    parser.add_argument('--score_only', action='store_true', help='점수만 계산하고 바이너리 마스크는 저장하지 않음')
+    parser.add_argument('--feature_cache', action='store_true', help='root/feature_cache 에 백본 특징 캐시 사용')
+    parser.add_argument('--feature_precision', choices=FEATURE_PRECISIONS, default=FEATURE_PRECISION,
+                        help='메모리 뱅크 특징 버퍼 / FAISS 인덱스 정밀도')
+    parser.add_argument('--feature_cache_mb', type=float, default=FEATURE_CACHE_MAX_MB, help='특징 캐시 최대 크기 (MB)')
+    parser.add_argument('--no_quantized_model', action='store_true',
+                        help='검증된 INT8 모델이 있어도 원본 (FP32) 모델 사용')
     
     args = parser.parse_args()
 
+    set_use_quantized_model(not args.no_quantized_model)
+
+    if args.feature_cache:
+        enable_feature_cache(args.root, max_mb=args.feature_cache_mb)
+    set_feature_precision(args.feature_precision)
+
     # A 클래스 인스턴스 생성
     a = A(root=args.root, line_a_path=args.line_a_path, line_b_path=args.line_b_path, gap=args.gap)
     
@@ -574,10 +951,15 @@ def main():
         brightness=args.brightness,
         contrast=args.contrast, 
         saturation=args.saturation,
-        hue=args.hue
+        hue=args.hue,
+        seed=args.seed,
+        write_masks=not args.score_only,
+        profile=args.profile
     )
     
     print(f"결과: {result}")
+    if a.last_profile is not None:
+        print(json.dumps({"profile": a.last_profile}, indent=2), file=sys.stderr)
     
     return result
 
@@ -0,0 +1,191 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# 메모리 뱅크 특징 저장 정밀도
+#   fp32: float32 버퍼 + IndexFlatL2 (기존 방식)
+#   fp16: float16 버퍼 + IndexScalarQuantizer(QT_fp16)
+#   sq8 : float16 버퍼 + IndexScalarQuantizer(QT_8bit)
+FEATURE_PRECISIONS = ("fp32", "fp16", "sq8")
+
+# 기본 캐시 크기 상한 (MB), 넘으면 가장 오래 사용하지 않은 항목부터 덮어씀
+FEATURE_CACHE_MAX_MB = 2048
+# 추론 결과와 같은 float32 로 저장 (hit / miss 에 관계없이 같은 점수가 나오도록)
+FEATURE_CACHE_DTYPE = np.float32
+
+_DATA_FILE = "features.f32"
+_LEGACY_DATA_FILES = ("features.f16", "features.f16.keys")  # 이전 float16 캐시 (더 이상 사용하지 않음)
+_INDEX_FILE = "index.sqlite"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """파일 내용의 sha256 (모델이 바뀌면 캐시를 구분하기 위함)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FeatureCache:
+    """
+    이미지별 백본 특징을 디스크에 보관하는 캐시 (모델 해시별 폴더)
+
+    - 데이터: 고정 크기 슬롯의 float32 memmap 파일 (슬롯 하나 = 이미지 한 장의 [P x D] 특징)
+    - 인덱스: sqlite (key -> slot, 마지막 사용 시각), 여러 워커 프로세스가 동시에 사용 가능
+    - key: 이미지 절대 경로 + 파일 크기 + mtime + 전처리 설정 (크롭 비율, 리사이즈 크기)
+    - 용량이 max_mb 를 넘으면 LRU 슬롯을 재사용
+    - 슬롯마다 key 해시를 함께 기록하여 읽는 도중 다른 프로세스가 덮어쓴 경우는 miss 로 처리
+    - 슬롯은 0 부터 빈틈없이 사용하므로 항목 수 (meta 'count') 가 곧 다음 빈 슬롯 번호
+    - memmap 은 프로세스 간에 바로 공유되므로 put 마다 디스크에 쓰지 않음 (flush() 로 한 번에 기록)
+    """
+    def __init__(self, folder, model_path, max_mb=FEATURE_CACHE_MAX_MB, preprocess=()):
+        self.folder = os.path.join(folder, file_hash(model_path)[:16])
+        os.makedirs(self.folder, exist_ok=True)
+        for name in _LEGACY_DATA_FILES:
+            if os.path.exists(os.path.join(self.folder, name)):
+                os.remove(os.path.join(self.folder, name))
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self.preprocess = tuple(preprocess)
+        self.hits = 0
+        self.misses = 0
+        self._pid = None
+        self._conn = None
+        self._data = None
+        self._slot_hashes = None
+        self._shape = None
+
+    # ---------------------------- 내부 구현 ---------------------------- #
+
+    def _connect(self):
+        # fork 된 워커는 부모의 sqlite 연결 / memmap 을 쓰지 않고 새로 연결
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        self._pid = os.getpid()
+        self._data = None
+        self._slot_hashes = None
+        self._conn = sqlite3.connect(os.path.join(self.folder, _INDEX_FILE), timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries "
+                           "(key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)")
+        # 항목 수를 meta 에 유지 (put 마다 COUNT(*) 로 전체를 세지 않도록), 없으면 한 번만 계산
+        self._conn.execute("INSERT OR IGNORE INTO meta SELECT 'count', COUNT(*) FROM entries")
+        self._load_shape()
+        return self._conn
+
+    def _load_shape(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE name='shape'").fetchone()
+        if row is not None:
+            self._shape = tuple(int(x) for x in row[0].split(","))
+
+    def _capacity(self):
+        slot_bytes = int(np.prod(self._shape)) * np.dtype(FEATURE_CACHE_DTYPE).itemsize + 8
+        return max(1, self.max_bytes // slot_bytes)
+
+    def _open_data(self, num_slots):
+        """슬롯 num_slots 개를 담을 수 있도록 데이터 파일을 늘리고 memmap 을 다시 연다"""
+        if self._data is not None and len(self._data) >= num_slots:
+            return
+        data_path = os.path.join(self.folder, _DATA_FILE)
+        hash_path = data_path + ".keys"
+        slot_size = int(np.prod(self._shape)) * np.dtype(FEATURE_CACHE_DTYPE).itemsize
+        for path, size in ((data_path, slot_size), (hash_path, 8)):
+            with open(path, "ab") as f:
+                if f.tell() < num_slots * size:
+                    f.truncate(num_slots * size)
+        num_slots = os.path.getsize(data_path) // slot_size
+        self._data = np.memmap(data_path, dtype=FEATURE_CACHE_DTYPE, mode="r+", shape=(num_slots, *self._shape))
+        self._slot_hashes = np.memmap(hash_path, dtype=np.int64, mode="r+", shape=(num_slots,))
+
+    def _key(self, img_path):
+        stat = os.stat(img_path)
+        return "|".join(str(x) for x in (os.path.abspath(img_path), stat.st_size, stat.st_mtime_ns,
+                                          *self.preprocess))
+
+    @staticmethod
+    def _key_hash(key):
+        # 0 은 "비어 있음 / 쓰는 중" 표시로 사용
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little",
+                              signed=True) or 1
+
+    # ---------------------------- 공개 API ----------------------------- #
+
+    def get(self, img_path):
+        """캐시된 특징 (float32) 반환, 없으면 None"""
+        conn = self._connect()
+        key = self._key(img_path)
+        row = conn.execute("SELECT slot FROM entries WHERE key=?", (key,)).fetchone()
+        if row is not None and self._shape is None:
+            self._load_shape()  # 다른 프로세스가 먼저 기록한 경우
+        if row is None or self._shape is None:
+            self.misses += 1
+            return None
+        slot = row[0]
+        self._open_data(slot + 1)
+        key_hash = self._key_hash(key)
+        if self._slot_hashes[slot] != key_hash:
+            self.misses += 1
+            return None
+        features = np.array(self._data[slot], dtype=np.float32)
+        if self._slot_hashes[slot] != key_hash:  # 읽는 도중 다른 프로세스가 덮어씀
+            self.misses += 1
+            return None
+        conn.execute("UPDATE entries SET last_used=? WHERE key=?", (time.time(), key))
+        self.hits += 1
+        return features
+
+    def put(self, img_path, features):
+        """특징을 캐시에 저장 (첫 저장 시 특징 shape 고정, 다른 shape 은 무시)"""
+        conn = self._connect()
+        key = self._key(img_path)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._shape is None:
+                self._load_shape()
+            if self._shape is None:
+                self._shape = tuple(features.shape)
+                conn.execute("INSERT OR IGNORE INTO meta VALUES ('shape', ?)",
+                             (",".join(str(x) for x in self._shape),))
+            if tuple(features.shape) != self._shape:
+                conn.execute("ROLLBACK")
+                return False
+
+            row = conn.execute("SELECT slot FROM entries WHERE key=?", (key,)).fetchone()
+            if row is not None:
+                slot = row[0]
+            else:
+                count = int(conn.execute("SELECT value FROM meta WHERE name='count'").fetchone()[0])
+                if count < self._capacity():
+                    # 슬롯은 삭제 없이 재사용만 되므로 항상 0 ~ count-1 이 사용 중
+                    slot = count
+                    conn.execute("UPDATE meta SET value=? WHERE name='count'", (str(count + 1),))
+                else:
+                    # 가장 오래 사용하지 않은 항목의 슬롯 재사용
+                    old_key, slot = conn.execute(
+                        "SELECT key, slot FROM entries ORDER BY last_used LIMIT 1").fetchone()
+                    conn.execute("DELETE FROM entries WHERE key=?", (old_key,))
+                conn.execute("INSERT INTO entries VALUES (?, ?, ?)", (key, slot, time.time()))
+
+            self._open_data(slot + 1)
+            self._slot_hashes[slot] = 0  # 쓰는 중 표시 (다른 프로세스는 miss 로 처리)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._data[slot] = features.astype(FEATURE_CACHE_DTYPE, copy=False)
+        self._slot_hashes[slot] = self._key_hash(key)
+        return True
+
+    def flush(self):
+        """memmap 변경 내용을 디스크에 기록 (데이터로더 한 바퀴 등 배치 단위로 호출)"""
+        if self._data is not None and self._pid == os.getpid():
+            self._data.flush()
+            self._slot_hashes.flush()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "folder": self.folder}
@@ -8,19 +8,106 @@ import sys
 import traceback
 import signal
 import os
+import shutil
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))) # windows 배포 시, 같은 경로 파일 import 위해 필요
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE" # windows 배포 시, ONNX 와 FAISS 의 OpenMP 충돌 우회를 위해 필요
 
 import atexit
 import multiprocessing as mp
-from multiprocessing import Process, Queue
+import queue
 #from main_simple_torch_normalize_each_anomalymap_shift_c import A
-from hpo_onnx import A
+
+from progress import report_progress as emit_progress, emit_message
+from feature_cache import FEATURE_CACHE_MAX_MB, FEATURE_PRECISIONS
+
+# torch / torchvision / onnxruntime / faiss 를 사용하는 파이프라인 (load_pipeline() 으로 import)
+A = WORKER_FOLDER = None
+set_num_threads = set_feature_precision = set_use_quantized_model = evaluation_settings = None
+enable_feature_cache = keep_worker_best = find_worker_best = promote_worker_best = None
+PRELOAD_SECONDS = 0.0  # 이 프로세스에서 파이프라인 import 에 걸린 시간 (초)
+
+
+def load_pipeline():
+    """
+    무거운 파이프라인 모듈을 import 하고 걸린 시간 (초) 반환, 이미 import 했으면 0
+    """
+    global A, WORKER_FOLDER, set_num_threads, set_feature_precision, set_use_quantized_model, evaluation_settings
+    global enable_feature_cache, keep_worker_best, find_worker_best, promote_worker_best, PRELOAD_SECONDS
+    if A is not None:
+        return 0.0
+    start = time.perf_counter()
+    from hpo_onnx import (
+        A, WORKER_FOLDER, set_num_threads, set_feature_precision, set_use_quantized_model, evaluation_settings,
+        enable_feature_cache,
+        keep_worker_best, find_worker_best, promote_worker_best
+    )
+    PRELOAD_SECONDS = time.perf_counter() - start
+    return PRELOAD_SECONDS
+
+
+# fork 가 가능하면 부모에서 미리 import 하여 워커가 이미 로드된 모듈을 그대로 물려받음
+# spawn (Windows) 워커는 이 파일을 __mp_main__ 으로 다시 import 하므로 워커마다 import 가 필요하고,
+# 부모는 워커를 먼저 시작한 뒤 import 하여 (main 참고) 부모 / 워커의 import 시간이 겹치도록 함
+if __name__ != "__main__" or "fork" in mp.get_all_start_methods():
+    load_pipeline()
 
 # 전역 변수로 프로세스 리스트 관리
 child_processes = []
 
+
+def get_worker_context():
+    """
+    워커 프로세스 생성 방식 선택
+    fork 를 지원하면 무거운 모듈이 로드된 부모를 그대로 복제하고, 아니면(Windows) spawn 사용
+    spawn 은 워커마다 torch / onnxruntime / faiss 를 다시 import 하므로 부모의 preload 로 기동 시간이 줄지 않음
+    (대신 워커는 run 동안 계속 살아 있으므로 import 는 trial 마다가 아니라 워커마다 한 번)
+    """
+    if "fork" in mp.get_all_start_methods():
+        return mp.get_context("fork")
+    return mp.get_context("spawn")
+
+
+# cold spawn 기동 시간 측정 대기 한도 (초)
+COLD_STARTUP_TIMEOUT = 300
+
+
+def _startup_probe(ready_queue):
+    """cold spawn 기동 측정용: spawn 된 프로세스가 이 파일 (파이프라인 포함) 을 import 한 직후 호출됨"""
+    ready_queue.put(time.time())
+
+
+def measure_cold_startup():
+    """
+    spawn 으로 새 프로세스 하나를 띄워 파이프라인 import 까지 걸린 시간 (초) 측정, 실패하면 None
+    fork 워커의 기동 시간과 비교하는 기준값 (워커의 기동 시간은 스레드 / 캐시 설정까지 포함하므로 절약 시간은 보수적)
+    """
+    ctx = mp.get_context("spawn")
+    ready_queue = ctx.Queue()
+    start = time.time()
+    probe = ctx.Process(target=_startup_probe, args=(ready_queue,), daemon=True)
+    probe.start()
+    try:
+        return ready_queue.get(timeout=COLD_STARTUP_TIMEOUT) - start
+    except queue.Empty:
+        return None
+    finally:
+        probe.join(timeout=COLD_STARTUP_TIMEOUT)
+        if probe.is_alive():
+            probe.terminate()
+
+# 요청 대기 중 워커 생존 여부를 확인하는 간격 (초)
+WORKER_CHECK_INTERVAL = 1.0
+
+# 평가 결과를 제출 전에 기록하는 로컬 journal 파일 (root 기준)
+JOURNAL_FILE = "hpo_journal.jsonl"
+# 재시작 시 재제출을 시도할 최대 횟수 (초과하면 더 이상 재제출하지 않음)
+MAX_REPLAY_ATTEMPTS = 3
+
+# 서버 요청용 공유 세션 (keep-alive 연결 재사용)
+http_session = requests.Session()
+http_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
 def cleanup_processes():
     """
     모든 자식 프로세스를 정리하는 함수
@@ -51,10 +138,24 @@ def signal_handler(sig, frame):
     cleanup_processes()
     sys.exit(0)
 
-def func(line_a_path, line_b_path, root=None, **kwargs):
+def func(line_a_path, line_b_path, root=None, worker_id=None, seed=None, **kwargs):
     """
     모델 학습 + 검증 후 점수를 구하는 예시 함수
     실제로는 이 부분에 모델 학습 및 평가 코드가 들어갈 것
+    worker_id 가 주어지면 메모리 뱅크 / anomaly map 을 워커 전용 폴더에 기록
+    seed 가 주어지면 같은 파라미터로 항상 같은 결과를 재현
+    """
+    score, _ = evaluate_trial(line_a_path, line_b_path, root, worker_id, seed, **kwargs)
+    return score
+
+
+def evaluate_trial(line_a_path, line_b_path, root=None, worker_id=None, seed=None, profile=False,
+                   save_memory_bank=True, incremental_memory_bank=False, **kwargs):
+    """
+    func 와 같지만 (점수, 평가에 사용한 A 인스턴스) 를 반환
+    A 인스턴스의 last_profile (profile=True 일 때) 과 메모리에 남은 메모리 뱅크를 이어서 사용 가능
+    save_memory_bank=False 이면 메모리 뱅크를 디스크에 쓰지 않음
+    incremental_memory_bank=True 이면 A_TRAIN coreset 을 프로세스 안에서 재사용 (A.func 참고)
     """
     brightness = kwargs.get('brightness', 0)
     contrast = kwargs.get('contrast', 0)
@@ -62,23 +163,58 @@ def func(line_a_path, line_b_path, root=None, **kwargs):
     hue = kwargs.get('hue', 0)
 
     # A 클래스 인스턴스 생성 시 경로 매개변수 전달
-    class_a = A(root=root, line_a_path=line_a_path, line_b_path=line_b_path)
+    class_a = A(root=root, line_a_path=line_a_path, line_b_path=line_b_path, worker_id=worker_id)
     
     # func 메서드에는 색상 조정 매개변수만 전달
-    score = class_a.func(brightness=brightness, contrast=contrast, saturation=saturation, hue=hue)
+    score = class_a.func(brightness=brightness, contrast=contrast, saturation=saturation, hue=hue, seed=seed,
+                         profile=profile, save_memory_bank=save_memory_bank,
+                         incremental_memory_bank=incremental_memory_bank)
 
-    return score
+    return score, class_a
+
+
+def trial_user_attrs(seed=None, profile=None, settings=None):
+    """서버에 trial user attribute 로 함께 저장할 값 (재현용 seed / 평가 설정, 단계별 profile 기록)"""
+    user_attrs = {}
+    if seed is not None:
+        user_attrs["seed"] = seed
+    if settings is not None:
+        user_attrs["settings"] = settings
+    if profile is not None:
+        user_attrs["profile"] = profile
+    return user_attrs or None
+
+
+def apply_evaluation_settings(root, settings, incremental_memory_bank):
+    """
+    trial 평가 당시의 설정 (dist_onnx.evaluation_settings) 을 현재 프로세스에 적용하고
+    func 에 넘길 incremental_memory_bank 값 반환
+    - 기록이 없으면 (이전 버전 journal) 현재 명령줄 설정을 그대로 사용
+    - 적용 후에도 설정이 다르면 (모델 파일이 바뀌었거나 검증된 INT8 모델이 없어짐) 같은 점수를 재현할 수 없으므로 None
+    """
+    if not settings:
+        print("[Client] 기록된 평가 설정이 없어 현재 명령줄 설정으로 평가합니다 (점수가 다를 수 있음)", file=sys.stderr)
+        return incremental_memory_bank
+    set_feature_precision(settings["feature_precision"])
+    set_use_quantized_model(settings["quantized_model"])
+    current = evaluation_settings(root, settings["incremental_memory_bank"])
+    if current != settings:
+        print(f"[Client] 평가 설정이 기록과 달라 같은 점수를 재현할 수 없습니다: 기록 {settings}, 현재 {current}",
+              file=sys.stderr)
+        return None
+    return settings["incremental_memory_bank"]
 
 
 def get_trial_params(server_url, study_id=None, max_retries=3):
     """
     서버에서 새 trial 파라미터를 요청
     study_id가 None이면 서버가 새 study_id를 생성해서 반환
+    여러 trial 을 동시에 진행하므로 concurrent 모드로 요청하고, 점수 제출에 쓸 trial_id 도 반환
     """
 
-    endpoint = f"{server_url}/trial"
+    endpoint = f"{server_url}/trial?concurrent=1"
     if study_id:
-        endpoint += f"?study_id={study_id}"
+        endpoint += f"&study_id={study_id}"
 
     for retry in range(max_retries):
         try:
@@ -86,15 +222,16 @@ def get_trial_params(server_url, study_id=None, max_retries=3):
                 f"[Client] 새 trial 파라미터 요청 중... (시도 {retry+1}/{max_retries})", file=sys.stderr)
 
             # 요청 전송
-            response = requests.get(endpoint, timeout=10)
+            response = http_session.get(endpoint, timeout=10)
 
             if response.status_code == 200:
                 data = response.json()
                 study_id = data["study_id"]
+                trial_id = data.get("trial_id")
                 params = data["params"]
                 print(
-                    f"[Client] 새 trial 파라미터 수신 성공: study_id={study_id}, params={params}", file=sys.stderr)
-                return study_id, params
+                    f"[Client] 새 trial 파라미터 수신 성공: study_id={study_id}, trial_id={trial_id}, params={params}", file=sys.stderr)
+                return study_id, trial_id, params
             else:
                 print(
                     f"[Client] 파라미터 요청 실패: HTTP {response.status_code} - {response.text}", file=sys.stderr)
@@ -110,12 +247,14 @@ def get_trial_params(server_url, study_id=None, max_retries=3):
             time.sleep(wait_time)
 
     print("[Client] 최대 재시도 횟수 초과, 파라미터 요청 실패", file=sys.stderr)
-    return None, None
+    return None, None, None
 
 
-def submit_score(server_url, study_id, score, max_retries=3):
+def submit_score(server_url, study_id, score, trial_id=None, user_attrs=None, max_retries=3):
     """
     trial 결과 점수를 서버에 제출
+    trial_id 가 없으면 서버는 가장 최근에 생성된 trial 에 점수를 기록
+    user_attrs 는 trial 의 user attribute 로 함께 저장됨 (예: 재현용 seed)
     """
     endpoint = f"{server_url}/score?study_id={study_id}"
     
@@ -126,6 +265,10 @@ def submit_score(server_url, study_id, score, max_retries=3):
         score = float(score)  # 다른 타입도 float으로 변환
         
     payload = {"score": score}
+    if trial_id is not None:
+        payload["trial_id"] = trial_id
+    if user_attrs:
+        payload["user_attrs"] = user_attrs
 
     for retry in range(max_retries):
         try:
@@ -133,7 +276,7 @@ def submit_score(server_url, study_id, score, max_retries=3):
                 f"[Client] 점수 제출 중: score={score}, study_id={study_id} (시도 {retry+1}/{max_retries})", file=sys.stderr)
 
             # 요청 전송
-            response = requests.post(endpoint, json=payload, timeout=10)
+            response = http_session.post(endpoint, json=payload, timeout=10)
 
             if response.status_code == 200:
                 print(f"[Client] 점수 제출 성공!", file=sys.stderr)
@@ -159,6 +302,15 @@ def get_best_params(server_url, study_id, max_retries=3):
     """
     최고의 파라미터를 서버에 요청
     """
+    best_trial = get_best_trial(server_url, study_id, max_retries)
+    return best_trial["params"] if best_trial else None
+
+
+def get_best_trial(server_url, study_id, max_retries=3):
+    """
+    최고 trial 정보를 서버에 요청
+    반환: {"study_id", "params", "trial_id", "score"} (실패 시 None)
+    """
     endpoint = f"{server_url}/best?study_id={study_id}"
 
     for retry in range(max_retries):
@@ -166,13 +318,13 @@ def get_best_params(server_url, study_id, max_retries=3):
             print(f"[Client] 최고 파라미터 요청 중... (시도 {retry+1}/{max_retries})", file=sys.stderr)
 
             # 요청 전송
-            response = requests.get(endpoint, timeout=10)
+            response = http_session.get(endpoint, timeout=10)
 
             if response.status_code == 200:
                 data = response.json()
-                best_params = data["params"]
-                print(f"[Client] 최고 파라미터 수신 성공: {best_params}", file=sys.stderr)
-                return best_params
+                print(f"[Client] 최고 파라미터 수신 성공: {data['params']} (trial_id={data.get('trial_id')})",
+                      file=sys.stderr)
+                return data
             else:
                 print(
                     f"[Client] 최고 파라미터 요청 실패: HTTP {response.status_code} - {response.text}", file=sys.stderr)
@@ -190,6 +342,129 @@ def get_best_params(server_url, study_id, max_retries=3):
     return None
 
 
+def cancel_trial(server_url, study_id, trial_id):
+    """
+    사용하지 않을 trial 을 서버에서 실패 처리 (예: 미리 받아두었지만 실행하지 않은 trial)
+    """
+    endpoint = f"{server_url}/cancel?study_id={study_id}"
+    try:
+        response = http_session.post(endpoint, json={"trial_id": trial_id}, timeout=10)
+        if response.status_code == 200:
+            print(f"[Client] 사용하지 않은 trial 취소: trial_id={trial_id}", file=sys.stderr)
+            return True
+        print(f"[Client] trial 취소 실패: HTTP {response.status_code} - {response.text}", file=sys.stderr)
+    except requests.RequestException as e:
+        print(f"[Client] 요청 중 오류 발생: {e}", file=sys.stderr)
+    return False
+
+
+class TrialJournal:
+    """
+    trial 평가 결과를 서버 제출 전에 기록하는 append-only journal (JSON Lines)
+
+    이벤트 종류:
+        evaluated: 평가 완료 (study_id, trial_id, seed, settings, params, score, profile, timings), 제출 직전에 기록
+        submitted: 서버 제출 성공
+        replay_failed: 재시작 후 재제출 실패
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, event, **record):
+        line = json.dumps({"event": event, "time": time.time(), **record})
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 기록 도중 종료되어 잘린 줄은 무시
+                    continue
+        return records
+
+    def find_evaluation(self, study_id, trial_id):
+        """journal 에 기록된 (study_id, trial_id) 의 마지막 evaluated 기록, 없으면 빈 dict"""
+        for record in reversed(self.read()):
+            if (record.get("event") == "evaluated" and record.get("study_id") == study_id
+                    and record.get("trial_id") == trial_id):
+                return record
+        return {}
+
+    def unsubmitted(self):
+        """평가는 끝났지만 아직 서버에 제출되지 않은 기록 목록"""
+        evaluated = {}
+        submitted = set()
+        failures = {}
+        for record in self.read():
+            key = (record.get("study_id"), record.get("trial_id"))
+            if record.get("event") == "evaluated":
+                evaluated[key] = record
+            elif record.get("event") == "submitted":
+                submitted.add(key)
+            elif record.get("event") == "replay_failed":
+                failures[key] = failures.get(key, 0) + 1
+        return [r for key, r in evaluated.items()
+                if key not in submitted and key[1] is not None
+                and failures.get(key, 0) < MAX_REPLAY_ATTEMPTS]
+
+
+def replay_journal(server_url, journal):
+    """
+    이전 실행에서 제출하지 못한 평가 결과를 서버에 다시 제출
+    (서버는 이미 실패 처리된 trial 이면 같은 파라미터의 완료된 trial 로 추가함)
+    """
+    pending = journal.unsubmitted()
+    if not pending:
+        return 0
+
+    print(f"[Main] journal 에서 미제출 결과 {len(pending)}개 재제출 중", file=sys.stderr)
+    replayed = 0
+    for record in pending:
+        study_id, trial_id = record["study_id"], record["trial_id"]
+        user_attrs = trial_user_attrs(record.get("seed"), record.get("profile"), record.get("settings"))
+        if submit_score(server_url, study_id, record["score"], trial_id, user_attrs, max_retries=1):
+            journal.append("submitted", study_id=study_id, trial_id=trial_id)
+            replayed += 1
+        else:
+            journal.append("replay_failed", study_id=study_id, trial_id=trial_id)
+    print(f"[Main] journal 재제출 완료: {replayed}/{len(pending)}", file=sys.stderr)
+    return replayed
+
+
+def regenerate_trial(args):
+    """
+    journal 에 기록된 완료 trial 의 파라미터로 메모리 뱅크 / anomaly map 을 공유 위치에 다시 생성
+    seed 와 평가 설정 (정밀도, 증분 메모리 뱅크, INT8 모델 여부) 도 기록된 값을 사용하고, 모델이 바뀌었으면 거부
+    """
+    journal = TrialJournal(args.journal or os.path.join(args.root or ".", JOURNAL_FILE))
+    records = [r for r in journal.read()
+               if r.get("event") == "evaluated" and r.get("trial_id") == args.regenerate_trial
+               and (args.study_id is None or r.get("study_id") == args.study_id)]
+    if not records:
+        print(f"[Client] journal 에서 trial_id={args.regenerate_trial} 기록을 찾을 수 없습니다.", file=sys.stderr)
+        return None
+
+    record = records[-1]
+    print(f"[Client] trial 재생성: study_id={record['study_id']}, trial_id={record['trial_id']}, "
+          f"params={record['params']}", file=sys.stderr)
+    incremental_memory_bank = apply_evaluation_settings(args.root, record.get("settings"),
+                                                        args.incremental_memory_bank)
+    if incremental_memory_bank is None:
+        return None
+    score = func(args.line_a_path, args.line_b_path, args.root, seed=record.get("seed"),
+                 incremental_memory_bank=incremental_memory_bank, **record["params"])
+    print(f"[Client] 재생성 완료: 점수 = {score:.6f} (기록된 점수 {record['score']:.6f})", file=sys.stderr)
+    return score
+
+
 def report_progress(progress, study_id=None, current_trial=None, total_trials=None, best_value=None, best_params=None):
     """
     진행 상황과 study_id를 Electron에 보고하는 함수
@@ -203,11 +478,8 @@ def report_progress(progress, study_id=None, current_trial=None, total_trials=No
         best_params: 현재까지의 최고 파라미터
     """
     # JSON 형식으로 진행 상황 보고
-    progress_data = {
-        "progress": round(progress, 2),
-        "status": "running"
-    }
-    
+    progress_data = {}
+
     # 추가 정보가 있으면 포함
     if study_id:
         progress_data["study_id"] = study_id
@@ -218,60 +490,108 @@ def report_progress(progress, study_id=None, current_trial=None, total_trials=No
         progress_data["best_value"] = round(float(best_value), 4)
     if best_params is not None:
         progress_data["best_params"] = best_params
-        
-    # stdout으로 JSON 출력 (Electron과의 통신용)
-    print(json.dumps(progress_data))
-    sys.stdout.flush()
 
-def worker_process(process_id, line_a_path, line_b_path, root, get_params_queue, params_result_queue, 
-                  submit_score_queue, submission_result_queue, max_trials_per_worker):
+    # trial 단위 보고는 드물기 때문에 전송 제한 없이 항상 보냄
+    emit_progress(progress, "running", force=True, **progress_data)
+
+def worker_process(process_id, line_a_path, line_b_path, root, request_queue, reply_queue,
+                  max_trials_per_worker, num_threads, start_time, profile=False, memory_bank_on_disk=False,
+                  feature_cache_mb=None, feature_precision="fp32", incremental_memory_bank=False,
+                  use_quantized_model=True):
     """
     자식 프로세스에서 실행되는 워커 함수
+    파라미터 요청과 점수 제출은 모두 request_queue 하나로 메인 프로세스에 전달되고,
+    응답은 이 워커 전용 reply_queue 로만 돌아옴 (워커당 처리 중인 요청은 항상 1개)
+    profile=True 이면 trial 마다 단계별 소요 시간 / 메모리 기록을 점수와 함께 제출
+    memory_bank_on_disk=False 이면 메모리 뱅크는 메모리에만 두고 워커 최고 점수 trial 일 때만 저장
+    feature_cache_mb 가 주어지면 root/feature_cache 의 백본 특징 캐시를 모든 워커가 공유
+    feature_precision 은 메모리 뱅크 특징 버퍼 / FAISS 인덱스 정밀도 (fp32 / fp16 / sq8)
+    incremental_memory_bank=True 이면 A_TRAIN coreset 을 워커 안에서 한 번만 계산하고 trial 마다 재사용
+    use_quantized_model=False 이면 검증된 INT8 모델이 있어도 FP32 모델 사용
     """
-    print(f"[Worker-{process_id}] 워커 프로세스 시작", file=sys.stderr)
+    print(f"[Worker-{process_id}] 워커 프로세스 시작 (스레드 {num_threads}개)", file=sys.stderr)
+    set_num_threads(num_threads)
+    set_feature_precision(feature_precision)
+    set_use_quantized_model(use_quantized_model)
+    if feature_cache_mb is not None:
+        enable_feature_cache(root, max_mb=feature_cache_mb)
+    # 점수에 영향을 주는 설정 (trial 재현 시 같은 설정으로 평가하기 위해 결과와 함께 기록)
+    settings = evaluation_settings(root, incremental_memory_bank)
     trials_completed = 0
+    local_best_score = None  # 이 워커가 지금까지 얻은 최고 점수 (best 폴더에 보관된 trial)
+
+    # 프로세스 생성부터 trial 을 받을 준비가 될 때까지 걸린 시간 보고
+    request_queue.put({
+        'type': 'ready',
+        'process_id': process_id,
+        'startup_seconds': time.time() - start_time
+    })
     
     try:
         while trials_completed < max_trials_per_worker:
             # 파라미터 요청을 큐에 추가
-            get_params_queue.put(process_id)
+            request_queue.put({
+                'type': 'get_params',
+                'process_id': process_id
+            })
             print(f"[Worker-{process_id}] 파라미터 요청 큐에 추가", file=sys.stderr)
             
             # 결과 대기
-            result = params_result_queue.get()
-            if result.get('process_id') != process_id:
-                # 다른 프로세스의 결과면 다시 큐에 넣고 재시도
-                params_result_queue.put(result)
-                time.sleep(0.1)
-                continue
+            result = reply_queue.get()
                 
             if not result.get('success'):
                 print(f"[Worker-{process_id}] 파라미터 요청 실패, 종료합니다", file=sys.stderr)
                 break
                 
             study_id = result.get('study_id')
+            trial_id = result.get('trial_id')
+            seed = result.get('seed')
             params = result.get('params')
             
             # 파라미터로 모델 학습 및 평가
             print(f"[Worker-{process_id}] 받은 파라미터로 모델 학습 중: {params}", file=sys.stderr)
-            score = func(line_a_path, line_b_path, root, **params)
+            eval_start = time.time()
+            score, class_a = evaluate_trial(line_a_path, line_b_path, root, worker_id=process_id, seed=seed,
+                                            profile=profile, save_memory_bank=memory_bank_on_disk,
+                                            incremental_memory_bank=incremental_memory_bank, **params)
+            trial_profile = class_a.last_profile
+            eval_end = time.time()
             print(f"[Worker-{process_id}] 모델 평가 완료: 점수 = {score:.6f}", file=sys.stderr)
+
+            # 이 워커의 최고 점수이면 결과물을 보관 (마지막에 재평가 없이 공유 위치로 옮기기 위함)
+            if local_best_score is None or score > local_best_score:
+                local_best_score = score
+                if not memory_bank_on_disk:
+                    class_a.save_memory_bank()
+                keep_worker_best(root, process_id, {
+                    'study_id': study_id,
+                    'trial_id': trial_id,
+                    'seed': seed,
+                    'settings': settings,
+                    'params': params,
+                    'score': float(score)
+                })
+            # 다음 trial 의 A 생성 전에 이번 trial 의 메모리 뱅크 해제
+            class_a = None
             
             # 점수 제출 요청을 큐에 추가
-            submit_score_queue.put({
+            request_queue.put({
+                'type': 'submit_score',
                 'process_id': process_id,
                 'study_id': study_id,
-                'score': score
+                'trial_id': trial_id,
+                'seed': seed,
+                'settings': settings,
+                'params': params,
+                'score': score,
+                'profile': trial_profile,
+                'eval_start': eval_start,
+                'eval_end': eval_end
             })
             print(f"[Worker-{process_id}] 점수 제출 큐에 추가", file=sys.stderr)
             
             # 제출 결과 대기
-            submission_result = submission_result_queue.get()
-            if submission_result.get('process_id') != process_id:
-                # 다른 프로세스의 결과면 다시 큐에 넣고 재시도
-                submission_result_queue.put(submission_result)
-                time.sleep(0.1)
-                continue
+            submission_result = reply_queue.get()
                 
             if not submission_result.get('success'):
                 print(f"[Worker-{process_id}] 점수 제출 실패, 종료합니다", file=sys.stderr)
@@ -309,7 +629,31 @@ def main():
                         default=30000, help="수행할 최대 trial 수")
     # 멀티프로세싱 관련 매개변수 추가
     parser.add_argument("--num_processes", type=int,
-                        default=1, help="사용할 프로세스 수") # /home/hee/electron_project/project/iqgen_scripts/memory/nnscorer_search_index.faiss 를 모두 공유하기 때문에 지금은 1개만 사용해야 함
+                        default=1, help="사용할 프로세스 수 (워커마다 root/workers/worker_N 전용 폴더 사용)")
+    parser.add_argument("--num_threads", type=int, default=None,
+                        help="전체 CPU 스레드 수 (없으면 CPU 코어 수), 워커들이 균등하게 나눠 사용")
+    parser.add_argument("--journal", type=str, default=None,
+                        help=f"평가 결과 journal 파일 경로 (없으면 root/{JOURNAL_FILE})")
+    parser.add_argument("--final_eval", action="store_true",
+                        help="마지막에 최고 파라미터로 다시 평가 (기본: best trial 결과물 재사용)")
+    parser.add_argument("--profile", action="store_true",
+                        help="trial 마다 단계별 소요 시간 / 메모리를 기록하여 서버 user attribute 로 제출")
+    parser.add_argument("--memory_bank_on_disk", action="store_true",
+                        help="trial 마다 메모리 뱅크를 디스크에 저장 (기본: 워커 최고 점수 trial 만 저장)")
+    parser.add_argument("--feature_cache", action="store_true",
+                        help="root/feature_cache 에 백본 특징을 캐시하여 재실행 / study 변경 시 재사용")
+    parser.add_argument("--feature_cache_mb", type=float, default=FEATURE_CACHE_MAX_MB,
+                        help="특징 캐시 최대 크기 (MB), 넘으면 오래 사용하지 않은 항목부터 교체")
+    parser.add_argument("--feature_precision", choices=FEATURE_PRECISIONS, default="fp32",
+                        help="메모리 뱅크 특징 버퍼 / FAISS 인덱스 정밀도 (fp16 / sq8 은 메모리 절약, 점수 오차 약간)")
+    parser.add_argument("--incremental_memory_bank", action="store_true",
+                        help="A_TRAIN coreset 을 워커마다 한 번만 계산하고 trial 마다 ColorJitter 특징만 이어서 선택")
+    parser.add_argument("--no_quantized_model", action="store_true",
+                        help="검증된 INT8 모델 (quantize_model.py) 이 있어도 원본 FP32 모델 사용")
+    parser.add_argument("--regenerate_trial", type=int, default=None,
+                        help="journal 에 기록된 trial_id 의 결과물을 다시 생성하고 종료 (--study_id 로 study 지정 가능)")
+    parser.add_argument("--measure_startup", action="store_true",
+                        help="워커 시작 전에 cold spawn 프로세스 하나의 기동 시간을 측정하여 fork 워커의 절약 시간 보고")
     args = parser.parse_args()
 
 
@@ -322,94 +666,192 @@ def main():
     print(f"[Client] - 최대 Trial 수: {args.max_trials}", file=sys.stderr)
     print(f"[Client] - 프로세스 수: {args.num_processes}", file=sys.stderr)
 
+    # 스레드 예산을 워커별로 분배 (torch / ONNX Runtime / FAISS 가 모두 같은 값을 사용)
+    total_threads = args.num_threads or os.cpu_count() or 1
+    threads_per_worker = max(1, total_threads // args.num_processes)
+    print(f"[Client] - 스레드 수: 전체 {total_threads}, 워커당 {threads_per_worker}", file=sys.stderr)
+
+    def setup_pipeline():
+        """부모 프로세스의 파이프라인 설정 (최종 평가 / 재생성용)"""
+        set_feature_precision(args.feature_precision)
+        set_use_quantized_model(not args.no_quantized_model)
+        if args.feature_cache:
+            # 최종 평가 / 재생성도 워커가 만든 캐시를 사용
+            enable_feature_cache(args.root, max_mb=args.feature_cache_mb)
+
+    if args.regenerate_trial is not None:
+        load_pipeline()
+        setup_pipeline()
+        set_num_threads(total_threads)
+        regenerate_trial(args)
+        return
+
     
     study_id = args.study_id
     # 현재 날짜시간 정보를 study_id 뒤에 붙이기
     if study_id:
         current_time = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
         study_id = f"{study_id}_{current_time}"
-    
+
     max_trials = args.max_trials
     best_score = None
     best_params = None
     trial_count = 0
+    issued_trials = 0   # 워커에게 전달한 trial 수
+    prefetched = None   # 평가 중에 미리 받아둔 다음 trial (study_id, trial_id, params)
+
 
+    # 워커 생성 방식 (fork 가능 시 fork, 아니면 spawn)
+    ctx = get_worker_context()
+    print(f"[Client] - 워커 생성 방식: {ctx.get_start_method()}", file=sys.stderr)
+
+    # fork 워커와 비교할 cold spawn 기동 시간 (워커 시작 전에 측정하여 서로 CPU 를 다투지 않도록 함)
+    cold_startup = None
+    if args.measure_startup:
+        if ctx.get_start_method() == "fork":
+            cold_startup = measure_cold_startup()
+            if cold_startup is not None:
+                print(f"[Client] - cold spawn 기동 시간: {cold_startup:.2f}초", file=sys.stderr)
+        else:
+            print(f"[Client] - {ctx.get_start_method()} 워커는 모두 cold 기동이므로 절약 시간 측정을 건너뜁니다",
+                  file=sys.stderr)
 
     # 큐 생성
-    get_params_queue = Queue()       # 파라미터 요청 큐
-    params_result_queue = Queue()    # 파라미터 결과 큐
-    submit_score_queue = Queue()     # 점수 제출 큐
-    submission_result_queue = Queue() # 제출 결과 큐
+    request_queue = ctx.Queue()      # 워커 요청 큐 (파라미터 요청 + 점수 제출)
+    reply_queues = [ctx.Queue() for _ in range(args.num_processes)]  # 워커별 응답 큐
     
     # 각 워커 프로세스가 처리할 trial 수 계산
     max_trials_per_worker = max_trials // args.num_processes
     if max_trials % args.num_processes > 0:
         max_trials_per_worker += 1
 
-    report_progress(0, study_id=study_id, current_trial=0, total_trials=max_trials, best_value=None)
-
-    # 워커 프로세스 시작
+    # 워커 프로세스 시작 (spawn 워커는 시작하자마자 import 를 시작하므로 부모의 나머지 준비보다 먼저)
     global child_processes
     processes = []
     for i in range(args.num_processes):
-        p = Process(target=worker_process, args=(
+        p = ctx.Process(target=worker_process, args=(
             i, args.line_a_path, args.line_b_path, args.root, 
-            get_params_queue, params_result_queue, submit_score_queue, 
-            submission_result_queue, max_trials_per_worker
+            request_queue, reply_queues[i], max_trials_per_worker, threads_per_worker, time.time(), args.profile,
+            args.memory_bank_on_disk, args.feature_cache_mb if args.feature_cache else None, args.feature_precision,
+            args.incremental_memory_bank, not args.no_quantized_model
         ))
         # 데몬 프로세스로 설정하여 메인 프로세스가 종료되면 함께 종료되도록 함
         p.daemon = True
         p.start()
         processes.append(p)
-    
+
     # 전역 변수에 프로세스 리스트 저장
     child_processes = processes
+
+    # spawn 이면 부모는 여기서 import (워커의 import 와 동시에 진행되어 첫 trial 까지 부모 import 시간만큼 단축)
+    parent_import = load_pipeline()
+    if parent_import > 0:
+        print(f"[Client] - 부모 파이프라인 import {parent_import:.2f}초 (워커 기동과 동시에 진행)", file=sys.stderr)
+    else:
+        print(f"[Client] - 부모 파이프라인 import {PRELOAD_SECONDS:.2f}초 (워커 시작 전, fork 워커가 물려받음)",
+              file=sys.stderr)
+    setup_pipeline()
+
+    # 이전 실행 (비정상 종료, 다른 study / 데이터셋, 더 많은 워커 수) 의 워커 폴더가 남아 있으면
+    # 다른 실행의 best 폴더가 이번 결과로 재사용될 수 있으므로 삭제
+    # 워커는 첫 파라미터를 받은 뒤에야 워커 폴더에 쓰므로 요청 처리 루프 전에만 지우면 됨
+    shutil.rmtree(os.path.join(args.root or "", WORKER_FOLDER), ignore_errors=True)
+
+    # 이전 실행에서 제출하지 못한 평가 결과가 있으면 먼저 재제출
+    journal = TrialJournal(args.journal or os.path.join(args.root or ".", JOURNAL_FILE))
+    replay_journal(args.server_url, journal)
+
+    report_progress(0, study_id=study_id, current_trial=0, total_trials=max_trials, best_value=None)
     
     try:
-        # 큐 모니터링 메인 루프
+        # 워커 요청 처리 메인 루프: 요청이 도착하는 즉시 처리 (폴링 sleep 없음)
         active_processes = len(processes)
         while active_processes > 0 and trial_count < max_trials:
-            # 살아있는 프로세스 수 확인
-            active_processes = sum(p.is_alive() for p in processes)
-            
-            # 파라미터 요청 큐 처리
-            if not get_params_queue.empty():
-                process_id = get_params_queue.get()
+            try:
+                # 요청이 올 때까지 대기, timeout 은 워커 생존 여부 확인용
+                request = request_queue.get(timeout=WORKER_CHECK_INTERVAL)
+            except queue.Empty:
+                active_processes = sum(p.is_alive() for p in processes)
+                continue
+
+            process_id = request['process_id']
+
+            # 워커 준비 완료 (기동 시간 보고)
+            if request['type'] == 'ready':
+                startup = request['startup_seconds']
+                if cold_startup is not None:
+                    print(f"[Main] 프로세스 {process_id} 준비 완료: 기동 {startup:.2f}초 "
+                          f"(cold spawn {cold_startup:.2f}초 대비 {cold_startup - startup:.2f}초 절약)", file=sys.stderr)
+                else:
+                    print(f"[Main] 프로세스 {process_id} 준비 완료: 기동 {startup:.2f}초", file=sys.stderr)
+
+            # 파라미터 요청 처리
+            elif request['type'] == 'get_params':
                 print(f"[Main] 프로세스 {process_id}의 파라미터 요청 처리 중", file=sys.stderr)
                 
-                # 서버에서 파라미터 요청
-                new_study_id, params = get_trial_params(args.server_url, study_id)
+                # 미리 받아둔 파라미터가 있으면 바로 사용, 없으면 서버에서 요청
+                if prefetched:
+                    new_study_id, trial_id, params = prefetched
+                    prefetched = None
+                else:
+                    new_study_id, trial_id, params = get_trial_params(args.server_url, study_id)
                 
                 if new_study_id and params:
                     # 성공 시 study_id 업데이트 (첫 번째 요청인 경우)
                     if not study_id:
                         study_id = new_study_id
                     
-                    # 결과를 파라미터 결과 큐에 추가
-                    params_result_queue.put({
+                    # 결과를 요청한 워커의 응답 큐에 추가
+                    reply_queues[process_id].put({
                         'process_id': process_id,
                         'success': True,
                         'study_id': new_study_id,
+                        'trial_id': trial_id,
+                        # trial 마다 새 seed 를 부여하고 journal / 서버에 기록하여 재현 가능하게 함
+                        'seed': random.randrange(2 ** 31),
                         'params': params
                     })
+                    issued_trials += 1
+
+                    # 워커가 평가하는 동안 다음 trial 파라미터를 미리 받아둠
+                    if issued_trials < max_trials:
+                        prefetched = get_trial_params(args.server_url, study_id)
+                        if not prefetched[0]:
+                            prefetched = None
                 else:
                     # 실패 시 오류 결과 전달
-                    params_result_queue.put({
+                    reply_queues[process_id].put({
                         'process_id': process_id,
                         'success': False
                     })
             
-            # 점수 제출 큐 처리
-            if not submit_score_queue.empty():
-                data = submit_score_queue.get()
-                process_id = data['process_id']
-                score_study_id = data['study_id']
-                score = data['score']
+            # 점수 제출 처리
+            elif request['type'] == 'submit_score':
+                score_study_id = request['study_id']
+                score_trial_id = request.get('trial_id')
+                score_seed = request.get('seed')
+                score_settings = request.get('settings')
+                score = request['score']
                 
                 print(f"[Main] 프로세스 {process_id}의 점수 제출 처리 중", file=sys.stderr)
                 
+                # 제출 전에 journal 에 기록 (제출 실패 / 비정상 종료 시 다음 실행에서 재제출)
+                journal.append("evaluated", study_id=score_study_id, trial_id=score_trial_id,
+                               seed=score_seed, settings=score_settings, params=request.get('params'),
+                               score=float(score),
+                               profile=request.get('profile'),
+                               timings={
+                                   "eval_start": request.get('eval_start'),
+                                   "eval_end": request.get('eval_end'),
+                                   "eval_seconds": request['eval_end'] - request['eval_start']
+                                   if request.get('eval_start') is not None else None
+                               })
+
                 # 서버에 점수 제출
-                success = submit_score(args.server_url, score_study_id, score)
+                success = submit_score(args.server_url, score_study_id, score, score_trial_id,
+                                       trial_user_attrs(score_seed, request.get('profile'), score_settings))
+                if success:
+                    journal.append("submitted", study_id=score_study_id, trial_id=score_trial_id)
                 
                 # 최고 점수 업데이트
                 if success and (best_score is None or score > best_score):
@@ -420,8 +862,8 @@ def main():
                         best_params = current_best_params
                         print(f"[Main] 현재까지 최고 파라미터: {best_params}", file=sys.stderr)
                 
-                # 결과를 제출 결과 큐에 추가
-                submission_result_queue.put({
+                # 결과를 요청한 워커의 응답 큐에 추가
+                reply_queues[process_id].put({
                     'process_id': process_id,
                     'success': success
                 })
@@ -433,30 +875,69 @@ def main():
                                total_trials=max_trials, best_value=best_score, best_params=best_params)
                 
                 print(f"[Main] Trial {trial_count}/{max_trials} 완료 (진행률: {progress:.2f}%)", file=sys.stderr)
-            
-            # 1초마다 큐 확인
-            time.sleep(1)
         
         # 모든 프로세스가 종료되었거나 최대 trial 수에 도달
         print(f"[Main] 모든 워커 프로세스 종료 대기 중...", file=sys.stderr)
         cleanup_processes()
+
+        # 미리 받아두었지만 사용하지 않은 trial 정리
+        if prefetched:
+            cancel_trial(args.server_url, prefetched[0], prefetched[1])
+            prefetched = None
         
         # 모든 trial 완료 후 최종 확인
         if trial_count > 0:
             print("\n[Client] === 최고 파라미터 최종 확인 ===", file=sys.stderr)
-            final_best_params = get_best_params(args.server_url, study_id)
-
-            if final_best_params:
-                # 최고 파라미터로 최종 평가 - 명령줄 인수도 함께 전달
-                final_score = func(args.line_a_path, args.line_b_path, args.root, **final_best_params)
-                print(f"\n[Client] === 최고 파라미터 최종 평가 ===", file=sys.stderr)
+            final_best_trial = get_best_trial(args.server_url, study_id)
+            final_best_params = final_best_trial["params"] if final_best_trial else None
+
+            # best trial 의 결과물이 이번 실행의 워커 best 폴더에 남아 있으면 재평가 없이 공유 위치로 이동
+            best_folder, best_record = (None, None)
+            if final_best_params and not args.final_eval:
+                best_folder, best_record = find_worker_best(args.root, final_best_params, study_id=study_id,
+                                                            trial_id=final_best_trial.get("trial_id"))
+
+            if best_folder:
+                promote_worker_best(best_folder, args.root, args.line_a_path, args.line_b_path)
+                final_score = best_record['score']
+                print(f"\n[Client] === 최고 파라미터 결과 재사용 (trial_id={best_record.get('trial_id')}) ===", file=sys.stderr)
                 print(f"[Client] - 파라미터: {final_best_params}", file=sys.stderr)
                 print(f"[Client] - 최종 점수: {final_score:.6f}", file=sys.stderr)
                 best_score = final_score
                 best_params = final_best_params
+            elif final_best_params:
+                # 최고 파라미터로 최종 평가 - 명령줄 인수도 함께 전달
+                # worker_id 없이 실행하므로 결과는 공유 위치(root/memory_dist, *_anomaly_maps)에 기록됨
+                # 워커가 모두 종료되었으므로 전체 스레드 예산 사용
+                set_num_threads(total_threads)
+                # 서버 best trial 의 seed / 평가 설정 사용 (journal 재제출 / 다른 클라이언트의 trial 일 수도 있으므로
+                # 이 클라이언트가 본 최고 점수의 값이 아니라 best trial 자신의 값), 없으면 journal 에서 찾음
+                record = journal.find_evaluation(study_id, final_best_trial.get("trial_id"))
+                final_seed = final_best_trial.get("seed")
+                if final_seed is None:
+                    final_seed = record.get("seed")
+                if final_seed is None:
+                    print("[Client] best trial 의 seed 를 찾을 수 없어 seed 없이 평가합니다 (결과 재현 불가)",
+                          file=sys.stderr)
+                final_incremental = apply_evaluation_settings(
+                    args.root, final_best_trial.get("settings") or record.get("settings"),
+                    args.incremental_memory_bank)
+                if final_incremental is None:
+                    print("[Client] 최고 파라미터 최종 평가를 건너뜁니다.", file=sys.stderr)
+                else:
+                    final_score = func(args.line_a_path, args.line_b_path, args.root, seed=final_seed,
+                                       incremental_memory_bank=final_incremental, **final_best_params)
+                    print(f"\n[Client] === 최고 파라미터 최종 평가 ===", file=sys.stderr)
+                    print(f"[Client] - 파라미터: {final_best_params}", file=sys.stderr)
+                    print(f"[Client] - 최종 점수: {final_score:.6f}", file=sys.stderr)
+                    best_score = final_score
+                    best_params = final_best_params
             else:
                 print("[Client] 최고 파라미터를 받을 수 없습니다.", file=sys.stderr)
 
+        # 워커 전용 작업 폴더 정리
+        shutil.rmtree(os.path.join(args.root or "", WORKER_FOLDER), ignore_errors=True)
+
     except KeyboardInterrupt:
         print("\n[Client] 사용자에 의해 중단되었습니다.", file=sys.stderr)
         cleanup_processes()
@@ -477,8 +958,7 @@ def main():
         "best_params": best_params
     }
     
-    print(json.dumps(completion_data))
-    sys.stdout.flush()
+    emit_message(completion_data)
     
     print("[Client] 클라이언트 종료", file=sys.stderr)
 
@@ -13,31 +13,27 @@ os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE" # windows 배포 시, ONNX 와 FAISS
 from dist_onnx import (
     RESIZE_SIZE, ANOMALY_MAP_FOLDER, MEMORY_BANK_FOLDER, MODEL_PATH, NUM_WORKERS,
     IMAGENET_MEAN, IMAGENET_STD, USE_IMAGENET_NORM, CENTER_CROP_RATE,
-    init_directories, get_image_paths, calculate_image_statistics,
+    WORKER_FOLDER, init_directories, get_worker_folder, get_image_paths, set_num_threads, enable_feature_cache,
+    set_feature_precision, set_use_quantized_model, evaluation_settings,
+    keep_worker_best, find_worker_best, promote_worker_best, derive_seed, make_color_dataloaders, calculate_image_statistics,
     TransformedDataset, load_onnx_model, get_patch_features,
-    create_memory_bank, compute_top_anomaly_scores, compute_anomaly_map,
+    create_memory_bank, get_base_memory_bank, compute_top_anomaly_scores, compute_anomaly_map,
     A as BaseA  # Import A class from dist_onnx as BaseA
 )
+from profiler import profiled
 
 # ------------------------------- Class A ----------------------------- #
 
 class A(BaseA):
-    def __init__(self, root="", line_a_path="", line_b_path=""):
-        # 경로 설정
-        self.root = root
-        self.line_a_path = line_a_path
-        self.line_b_path = line_b_path
-
-        # 폴더 및 모델 경로 설정
-        self.anomaly_map_folder = os.path.join(root, ANOMALY_MAP_FOLDER)
-        self.memory_bank_folder = os.path.join(root, MEMORY_BANK_FOLDER)
-        self.model_path = os.path.join(root, MODEL_PATH)
+    def __init__(self, root="", line_a_path="", line_b_path="", worker_id=None):
+        # 경로 설정 (worker_id 가 있으면 워커 전용 폴더 사용)
+        self.init_paths(root, line_a_path, line_b_path, worker_id)
         
         # 디렉토리 초기화
         init_directories(self.anomaly_map_folder, self.memory_bank_folder)
 
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = load_onnx_model(self.model_path)
+        # 모델 / 메모리 뱅크 / 마지막 anomaly map 상태는 dist_onnx.A 와 같은 초기화 사용
+        self.init_model_state()
 
         # ONNX 모델은 이미 정규화가 포함되어 있으므로 0-1 범위로만 변환 (정규화 생략)
         print("ONNX 모델은 이미 ImageNet 정규화가 포함되어 있어 추가 정규화를 생략합니다.")
@@ -106,7 +102,9 @@ class A(BaseA):
         )
 
     # hpo_onnx.py 전용 함수 구현
-    def func(self, brightness: float = 0.0, contrast: float = 0.0, saturation: float = 0.0, hue: float = 0.0) -> float:
+    @profiled
+    def func(self, brightness: float = 0.0, contrast: float = 0.0, saturation: float = 0.0, hue: float = 0.0,
+             seed: int = None, save_memory_bank: bool = True, incremental_memory_bank: bool = False) -> float:
         """
         1) A_TRAIN_COLOR 생성: A_TRAIN 각 이미지에 ColorJitter 파라미터 내에서 랜덤한 색상 변환 적용
         2) A_TRAIN + A_TRAIN_COLOR 로 메모리 뱅크 생성
@@ -117,6 +115,11 @@ class A(BaseA):
             contrast: 대비 변화 최대 강도 (0: 변화 없음, 값이 클수록 더 큰 변화 가능성)
             saturation: 채도 변화 최대 강도 (0: 변화 없음, 값이 클수록 더 큰 변화 가능성)
             hue: 색조 변화 최대 강도 (0: 변화 없음, 값이 클수록 더 큰 변화 가능성)
+            seed: ColorJitter 와 coreset 샘플링의 랜덤 선택을 고정하는 trial seed (None 이면 매번 다름)
+            save_memory_bank: False 이면 메모리 뱅크를 디스크에 쓰지 않음 (필요 시 save_memory_bank() 로 저장)
+            incremental_memory_bank: True 이면 A_TRAIN coreset 은 프로세스에서 한 번만 계산해 재사용하고,
+                trial 마다 A_COLOR 특징에서만 이어서 coreset 을 선택 (전체를 다시 선택한 결과와 약간 다름)
+            profile: True 이면 단계별 소요 시간 / 메모리 기록을 self.last_profile 에 저장
 
         HPO 파라미터 범위 추천:
         - brightness: 0.0 ~ 0.5
@@ -138,21 +141,39 @@ class A(BaseA):
         dl_a_training = DataLoader(self.ds_a_training, batch_size=1, shuffle=False, num_workers=NUM_WORKERS)
         dl_a_test = DataLoader(self.ds_a_test, batch_size=1, shuffle=False, num_workers=NUM_WORKERS)
 
-        # A_COLOR transform 업데이트 (init에서 생성된 데이터셋 재사용)
+        # A_COLOR transform 적용 (init에서 생성된 데이터셋 재사용, pass 마다 다른 seed)
         color_tf = T.ColorJitter(brightness=brightness, contrast=contrast, saturation=saturation, hue=hue)
-        self.ds_a_color.update_transform(color_tf)
-        dl_a_color = DataLoader(self.ds_a_color, batch_size=1, shuffle=False, num_workers=NUM_WORKERS)
+        dl_a_colors = make_color_dataloaders(self.ds_a_color, color_tf, 3, seed=seed)
         
         # B_TEST 데이터로더 생성
         dl_b_test = DataLoader(self.ds_b_test, batch_size=1, shuffle=False, num_workers=NUM_WORKERS)
         
         # --- 메모리 뱅크 (A_TRAINING + A_COLOR) --- #
-        mb_mgr = create_memory_bank(
-            [self.line_a_path, f"{self.line_a_path}_COLOR1", f"{self.line_a_path}_COLOR2", f"{self.line_a_path}_COLOR3"],
-            self.model,
-            [dl_a_training, dl_a_color, dl_a_color, dl_a_color],
-            memory_bank_folder=self.memory_bank_folder,
-        )
+        color_paths = [f"{self.line_a_path}_COLOR{i + 1}" for i in range(len(dl_a_colors))]
+        if incremental_memory_bank:
+            # A_TRAIN 부분은 trial 마다 같으므로 base 를 재사용하고 A_COLOR 만 이어서 추가
+            ratio_images = len(self.ds_a_training) * (1 + len(dl_a_colors))
+            base = get_base_memory_bank(self.line_a_path, self.model, self.model_path, dl_a_training, ratio_images)
+            mb_mgr = create_memory_bank(
+                color_paths,
+                self.model,
+                dl_a_colors,
+                memory_bank_folder=self.memory_bank_folder,
+                seed=seed,
+                persist=save_memory_bank,
+                base=base,
+                ratio_images=ratio_images,
+            )
+        else:
+            mb_mgr = create_memory_bank(
+                [self.line_a_path, *color_paths],
+                self.model,
+                [dl_a_training, *dl_a_colors],
+                memory_bank_folder=self.memory_bank_folder,
+                seed=seed,
+                persist=save_memory_bank,
+            )
+        self.mb_mgr = mb_mgr
 
         # --- A_TEST에 대한 anomaly score 계산 --- #
         results_a_test = compute_top_anomaly_scores(dl_a_test, mb_mgr, self.model, top_percent=0.1)
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import onnxruntime as ort
+
+# 사용 가능한 것 중 앞쪽부터 선택 (CPUExecutionProvider 는 항상 마지막 fallback 으로 추가)
+PREFERRED_PROVIDERS = ("CUDAExecutionProvider", "DmlExecutionProvider", "CPUExecutionProvider")
+# 쉼표로 구분한 provider 목록으로 자동 선택을 덮어씀 (예: IQGEN_ORT_PROVIDERS=CPUExecutionProvider)
+PROVIDERS_ENV = "IQGEN_ORT_PROVIDERS"
+
+# 최적화된 모델 캐시 폴더 (모델 파일과 같은 폴더 아래), None 이면 캐시하지 않음
+OPTIMIZED_MODEL_FOLDER = ".ort_cache"
+
+
+def detect_providers(preferred=None):
+    """
+    설치된 onnxruntime 에서 사용 가능한 provider 목록 (선호 순서, CPU fallback 포함)
+    preferred 가 없으면 IQGEN_ORT_PROVIDERS 환경 변수, 그것도 없으면 PREFERRED_PROVIDERS 순서
+    """
+    if preferred is None:
+        env = os.environ.get(PROVIDERS_ENV)
+        preferred = [p.strip() for p in env.split(",") if p.strip()] if env else PREFERRED_PROVIDERS
+    available = ort.get_available_providers()
+    providers = [p for p in preferred if p in available]
+    if "CPUExecutionProvider" not in providers:
+        providers.append("CPUExecutionProvider")
+    return providers
+
+
+def create_session_options(num_threads=None, providers=(),
+                           optimization_level=ort.GraphOptimizationLevel.ORT_ENABLE_ALL):
+    """
+    반복 추론용 SessionOptions
+    - num_threads: 연산 내부 스레드 수 (None 이면 onnxruntime 기본값), 연산 간 병렬 실행은 하지 않음
+    - 입력 shape 이 고정이므로 메모리 arena / 메모리 패턴 재사용 (DirectML 은 메모리 패턴 미지원)
+    """
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = optimization_level
+    sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    if num_threads is not None:
+        sess_options.intra_op_num_threads = num_threads
+        sess_options.inter_op_num_threads = 1
+    sess_options.enable_cpu_mem_arena = True
+    sess_options.enable_mem_pattern = "DmlExecutionProvider" not in providers
+    return sess_options
+
+
+def optimized_model_path(model_path, providers, cache_folder=OPTIMIZED_MODEL_FOLDER):
+    """
+    그래프 최적화 결과를 저장할 캐시 파일 경로
+    모델 파일 (크기, 수정 시각), onnxruntime 버전, 주 provider 가 바뀌면 다른 파일을 사용
+    """
+    stat = os.stat(model_path)
+    key = "|".join(str(x) for x in (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns,
+                                     ort.__version__, providers[0]))
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), cache_folder, f"{name}.{digest}.onnx")
+
+
+def _save_optimized_model(model_path, cache_path, providers):
+    """
+    최적화된 모델을 cache_path 에 저장
+    하드웨어 전용 layout 변환은 제외 (EXTENDED 까지) 하고, 읽을 때 ORT_ENABLE_ALL 로 나머지만 적용
+    여러 워커가 동시에 시작해도 완성된 파일만 보이도록 임시 파일에 쓴 뒤 이름을 바꿈
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    sess_options = create_session_options(
+        providers=providers, optimization_level=ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED)
+    sess_options.optimized_model_filepath = tmp_path
+    try:
+        ort.InferenceSession(model_path, sess_options=sess_options, providers=providers)
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def create_session(model_path, num_threads=None, providers=None, cache_folder=OPTIMIZED_MODEL_FOLDER):
+    """
+    provider 자동 선택 + 튜닝된 SessionOptions 로 InferenceSession 생성
+    cache_folder 가 있으면 그래프 최적화 결과를 파일로 남겨 다음 실행부터 최적화 단계를 건너뜀
+    (캐시를 쓸 수 없으면 원본 모델로 세션 생성)
+    """
+    if providers is None:
+        providers = detect_providers()
+    load_path = model_path
+    if cache_folder is not None:
+        try:
+            cache_path = optimized_model_path(model_path, providers, cache_folder)
+            if not os.path.exists(cache_path):
+                _save_optimized_model(model_path, cache_path, providers)
+            load_path = cache_path
+        except Exception as e:
+            print(f"최적화 모델 캐시를 사용하지 않습니다: {e}")
+    sess_options = create_session_options(num_threads, providers)
+    try:
+        session = ort.InferenceSession(load_path, sess_options=sess_options, providers=providers)
+    except Exception as e:
+        if load_path == model_path:
+            raise
+        # 캐시 파일이 손상된 경우 원본으로 생성 (다음 실행에서 다시 저장하도록 캐시 삭제)
+        print(f"최적화 모델 캐시를 읽을 수 없어 원본 모델을 사용합니다: {e}")
+        if os.path.exists(load_path):
+            os.remove(load_path)
+        session = ort.InferenceSession(model_path, sess_options=sess_options, providers=providers)
+    print(f"ONNX 세션 생성: {os.path.basename(model_path)} (providers: {session.get_providers()})")
+    return session
+
+# quantize_model.py 가 만드는 INT8 모델 / 정확도 검증 보고서 (원본 모델과 같은 폴더)
+QUANTIZED_MODEL_SUFFIX = ".int8"
+
+
+def quantized_model_paths(model_path):
+    """(INT8 모델 경로, 정확도 검증 보고서 JSON 경로)"""
+    base = os.path.splitext(model_path)[0] + QUANTIZED_MODEL_SUFFIX
+    return base + ".onnx", base + ".json"
+
+
+def model_signature(model_path):
+    """보고서가 어떤 원본 모델로 만들어졌는지 확인하기 위한 (크기, 수정 시각)"""
+    stat = os.stat(model_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def select_model_path(model_path):
+    """
+    INT8 모델이 있고, 현재 원본 모델로 만든 보고서가 정확도 검증을 통과했으면 INT8 모델 경로, 아니면 model_path
+    """
+    quantized_path, report_path = quantized_model_paths(model_path)
+    if not (os.path.exists(quantized_path) and os.path.exists(report_path)):
+        return model_path
+    try:
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return model_path
+    if not report.get("passed") or report.get("source") != model_signature(model_path):
+        return model_path
+    return quantized_path
+
+
+class BoundSession:
+    """
+    IOBinding 으로 입력 / 출력 버퍼를 재사용하는 InferenceSession wrapper (같은 입력 shape 을 반복 실행할 때)
+
+    - 입력: CPU 는 numpy 배열을 복사 없이 그대로 바인딩, CUDA 는 미리 할당한 device 버퍼에 덮어씀
+    - 출력: 입력 shape 별로 미리 할당한 host 버퍼에 직접 기록 (매 run 마다 새 배열을 만들지 않음)
+    - 출력 shape 은 입력 shape 별 첫 실행 결과로 정함 (첫 실행은 일반 run)
+    - 그 밖의 속성 (get_inputs, run, get_providers 등) 은 원래 세션으로 전달
+    - 스레드 하나에서만 사용 (버퍼를 공유하므로)
+    """
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.output_name = session.get_outputs()[0].name
+        self.device = "cuda" if session.get_providers()[0] == "CUDAExecutionProvider" else "cpu"
+        self._bindings = {}  # 입력 shape -> (IOBinding, device 입력 OrtValue 또는 None, 출력 버퍼)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def _create_binding(self, shape, output_shape):
+        binding = self.session.io_binding()
+        device_input = None
+        if self.device == "cuda":
+            device_input = ort.OrtValue.ortvalue_from_shape_and_type(shape, np.float32, "cuda", 0)
+            binding.bind_ortvalue_input(self.input_name, device_input)
+        output = np.empty(output_shape, dtype=np.float32)
+        binding.bind_output(self.output_name, "cpu", 0, np.float32, output.shape, output.ctypes.data)
+        return binding, device_input, output
+
+    def run_bound(self, inputs, reuse_output=False):
+        """
+        첫 번째 출력 반환
+        inputs: float32 C-contiguous 배열 (아니면 변환 시 한 번 복사)
+        reuse_output=True 이면 재사용 버퍼 자체를 반환 (다음 run_bound 호출 전까지만 유효, 바로 복사해서 사용)
+        """
+        inputs = np.ascontiguousarray(inputs, dtype=np.float32)
+        entry = self._bindings.get(inputs.shape)
+        if entry is None:
+            outputs = self.session.run([self.output_name], {self.input_name: inputs})[0]
+            self._bindings[inputs.shape] = self._create_binding(inputs.shape, outputs.shape)
+            return outputs
+
+        binding, device_input, output = entry
+        if device_input is None:
+            binding.bind_cpu_input(self.input_name, inputs)
+        else:
+            device_input.update_inplace(inputs)
+        self.session.run_with_iobinding(binding)
+        return output if reuse_output else output.copy()
@@ -0,0 +1,137 @@
+import contextlib
+import functools
+import os
+import threading
+import time
+
+import torch
+
+try:
+    import psutil  # 있으면 RSS 측정에 사용 (없으면 /proc 사용, 둘 다 없으면 메모리 측정 생략)
+except ImportError:
+    psutil = None
+
+# 백그라운드 메모리 샘플링 간격 (초)
+MEMORY_SAMPLE_INTERVAL = 0.05
+
+
+def current_rss_mb():
+    """현재 프로세스의 RSS (MB), 측정할 수 없으면 None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class StageProfiler:
+    """
+    trial 한 번의 단계별 소요 시간과 메모리 사용량을 기록하는 profiler
+
+    - stage(name) 으로 감싼 구간의 누적 시간 / 호출 횟수 / 종료 시점 RSS 최대값을 기록
+    - with 블록 동안 백그라운드 스레드가 RSS 를 샘플링하여 전체 peak 를 기록
+    - with 블록 동안 활성화되어 profile_stage() 호출이 이 profiler 로 기록됨
+      (DataLoader num_workers > 0 이면 자식 프로세스의 decode / jitter 시간은 기록되지 않음)
+    """
+    def __init__(self, sample_interval=MEMORY_SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self.stages = {}
+        self.start_time = None
+        self.total_seconds = None
+        self.peak_rss_mb = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._previous = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_rss_mb is None or rss > self.peak_rss_mb):
+            self.peak_rss_mb = rss
+        return rss
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            self._sample()
+
+    def __enter__(self):
+        global _active_profiler
+        self._previous = _active_profiler
+        _active_profiler = self
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        self._sample()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active_profiler
+        self.total_seconds = time.perf_counter() - self.start_time
+        self._stop.set()
+        self._sampler.join()
+        self._sample()
+        _active_profiler = self._previous
+        return False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            rss = self._sample()
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "rss_mb": None})
+            entry["seconds"] += elapsed
+            entry["calls"] += 1
+            if rss is not None and (entry["rss_mb"] is None or rss > entry["rss_mb"]):
+                entry["rss_mb"] = rss
+
+    def record(self):
+        """JSON 으로 저장 / 전송 가능한 per-trial 기록 dict"""
+        return {
+            "total_seconds": round(self.total_seconds, 4) if self.total_seconds is not None else None,
+            "stages": {
+                name: {
+                    "seconds": round(entry["seconds"], 4),
+                    "calls": entry["calls"],
+                    "rss_mb": round(entry["rss_mb"], 1) if entry["rss_mb"] is not None else None,
+                }
+                for name, entry in self.stages.items()
+            },
+            "peak_rss_mb": round(self.peak_rss_mb, 1) if self.peak_rss_mb is not None else None,
+            "peak_cuda_mb": round(torch.cuda.max_memory_allocated() / 2 ** 20, 1)
+            if torch.cuda.is_available() else None,
+        }
+
+
+_active_profiler = None
+_null_stage = contextlib.nullcontext()
+
+
+def profile_stage(name):
+    """활성화된 profiler 가 있으면 name 구간을 기록, 없으면 아무것도 하지 않음"""
+    if _active_profiler is None:
+        return _null_stage
+    return _active_profiler.stage(name)
+
+
+def profiled(method):
+    """
+    A.func 용 decorator: profile=True 로 호출하면 단계별 기록을 self.last_profile 에 저장
+    (profile=False 이면 self.last_profile 은 None)
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, profile=False, **kwargs):
+        self.last_profile = None
+        if not profile:
+            return method(self, *args, **kwargs)
+        with StageProfiler() as profiler:
+            result = method(self, *args, **kwargs)
+        self.last_profile = profiler.record()
+        return result
+    return wrapper
@@ -0,0 +1,133 @@
+import json
+import os
+import socket
+import sys
+import time
+
+# 진행 상황 전송 간격 제한 (초) / 최소 진행률 변화량 (%)
+PROGRESS_MIN_INTERVAL = 0.5
+PROGRESS_MIN_DELTA = 5.0
+
+# stdout 대신 진행 상황을 보낼 곳 (Electron 이 설정)
+#   IQGEN_PROGRESS_SOCKET=host:port  -> 로컬 TCP 소켓
+#   IQGEN_PROGRESS_FD=<fd>           -> 상속받은 pipe 파일 디스크립터
+PROGRESS_SOCKET_ENV = "IQGEN_PROGRESS_SOCKET"
+PROGRESS_FD_ENV = "IQGEN_PROGRESS_FD"
+
+
+def _open_sink():
+    """환경 변수에 따라 진행 상황 출력 대상 (write(str) 함수) 반환, 기본은 stdout"""
+    address = os.environ.get(PROGRESS_SOCKET_ENV)
+    if address:
+        try:
+            host, port = address.rsplit(":", 1)
+            sock = socket.create_connection((host, int(port)), timeout=5)
+            return lambda line: sock.sendall(line.encode("utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"[Progress] 소켓 연결 실패, stdout 사용: {e}", file=sys.stderr)
+
+    fd = os.environ.get(PROGRESS_FD_ENV)
+    if fd:
+        try:
+            pipe = os.fdopen(int(fd), "w", encoding="utf-8", buffering=1)
+            return pipe.write
+        except (OSError, ValueError) as e:
+            print(f"[Progress] pipe 열기 실패, stdout 사용: {e}", file=sys.stderr)
+
+    def write_stdout(line):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    return write_stdout
+
+
+class ProgressReporter:
+    """
+    Electron 으로 진행 상황(JSON 한 줄)을 보내는 공통 클래스
+
+    - 시간 간격(min_interval)과 진행률 변화량(min_delta)으로 전송 횟수를 제한
+    - status(단계)가 바뀌거나 0/100% 이거나 force=True 이면 항상 전송
+    - 매 메시지에 전체 경과 시간(elapsed)과 현재 단계 경과 시간(stage_elapsed)을 포함
+    """
+    def __init__(self, min_interval=PROGRESS_MIN_INTERVAL, min_delta=PROGRESS_MIN_DELTA):
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.start_time = time.perf_counter()
+        self.stage = None
+        self.stage_start = self.start_time
+        self.last_time = None
+        self.last_progress = None
+        self._sink = None
+        self._pid = None
+
+    def _write(self, line):
+        # fork 된 자식 프로세스는 부모의 소켓을 공유하지 않도록 새로 연결
+        if self._sink is None or self._pid != os.getpid():
+            self._sink = _open_sink()
+            self._pid = os.getpid()
+        try:
+            self._sink(line)
+        except OSError as e:
+            print(f"[Progress] 전송 실패: {e}", file=sys.stderr)
+
+    def _should_emit(self, progress, now):
+        if self.last_time is None or progress <= 0 or progress >= 100:
+            return True
+        if abs(progress - self.last_progress) >= self.min_delta:
+            return True
+        return now - self.last_time >= self.min_interval and progress != self.last_progress
+
+    def report(self, progress, status=None, force=False, **fields):
+        """
+        진행 상황 보고 (제한 조건에 걸리면 전송하지 않고 False 반환)
+
+        매개변수:
+            progress: 0에서 100 사이의 진행률
+            status: 현재 단계 / 상태 메시지 (바뀌면 단계 시간 측정을 새로 시작)
+            force: True 이면 제한과 무관하게 전송
+            fields: 메시지에 함께 넣을 추가 필드
+        """
+        now = time.perf_counter()
+        stage_changed = status is not None and status != self.stage
+        if stage_changed:
+            self.stage = status
+            self.stage_start = now
+
+        if not (force or stage_changed or self._should_emit(progress, now)):
+            return False
+
+        progress_data = {"progress": round(progress, 2)}
+        if status is not None:
+            progress_data["status"] = status
+        progress_data.update(fields)
+        progress_data["elapsed"] = round(now - self.start_time, 3)
+        progress_data["stage_elapsed"] = round(now - self.stage_start, 3)
+
+        self._write(json.dumps(progress_data) + "\n")
+        self.last_time = now
+        self.last_progress = progress
+        return True
+
+    def emit(self, data):
+        """완료 메시지 등 그대로 전달해야 하는 JSON 을 제한 없이 전송"""
+        self._write(json.dumps(data) + "\n")
+
+
+_reporter = None
+
+
+def get_reporter():
+    """프로세스 공용 ProgressReporter 반환"""
+    global _reporter
+    if _reporter is None:
+        _reporter = ProgressReporter()
+    return _reporter
+
+
+def report_progress(progress, status=None, force=False, **fields):
+    """공용 reporter 로 진행 상황 보고 (ProgressReporter.report 참고)"""
+    return get_reporter().report(progress, status, force, **fields)
+
+
+def emit_message(data):
+    """공용 reporter 로 JSON 메시지를 제한 없이 전송"""
+    get_reporter().emit(data)
@@ -0,0 +1,173 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from torch.utils.data import DataLoader
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))) # windows 배포 시, 같은 경로 파일 import 위해 필요
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE" # windows 배포 시, ONNX 와 FAISS 의 OpenMP 충돌 우회를 위해 필요
+
+from onnxruntime.quantization import (
+    CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+)
+
+from onnx_session import PROVIDERS_ENV, quantized_model_paths, model_signature
+from dist_onnx import (
+    MODEL_PATH, NUM_WORKERS, TransformedDataset, load_onnx_model, create_memory_bank, compute_anomaly_maps,
+    top_mean_scores, set_num_threads
+)
+
+# A 클래스와 같은 데이터 분할 (A_TRAIN: 뒤 80% 중 50장, A_TEST / B_TEST: 앞 80% 중 30장)
+TRAIN_SPLIT = 0.8
+TRAIN_LIMIT = 50
+TEST_LIMIT = 30
+
+# 정확도 검증 기준: FP32 대비 이미지별 점수 평균 상대 오차와 B-A 점수 차이의 상대 오차
+DEFAULT_TOLERANCE = 0.05
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """정적 양자화 보정용 입력 (A 와 같은 전처리를 거친 A_TRAIN 이미지를 한 장씩)"""
+    def __init__(self, dataset, input_name, limit=None):
+        self.dataset = dataset
+        self.input_name = input_name
+        self.indices = iter(range(min(len(dataset), limit or len(dataset))))
+
+    def get_next(self):
+        idx = next(self.indices, None)
+        if idx is None:
+            return None
+        img, _ = self.dataset[idx]
+        return {self.input_name: np.ascontiguousarray(img.numpy()[None], dtype=np.float32)}
+
+
+def make_datasets(line_a_path, line_b_path):
+    """(A_TRAIN, A_TEST, B_TEST) 데이터셋"""
+    return (
+        TransformedDataset(line_a_path, resize=True, limit=TRAIN_LIMIT, train_split=TRAIN_SPLIT),
+        TransformedDataset(line_a_path, resize=True, limit=TEST_LIMIT, train_split=-TRAIN_SPLIT),
+        TransformedDataset(line_b_path, resize=True, limit=TEST_LIMIT, train_split=-TRAIN_SPLIT),
+    )
+
+
+def quantize(model_path, output_path, method, calibration_reader=None):
+    """
+    method: "dynamic" (가중치만 INT8, 보정 불필요) 또는 "static" (활성값까지 INT8, QDQ 형식, 보정 필요)
+    """
+    if method == "dynamic":
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8, per_channel=True)
+        return output_path
+
+    # 보정 전 shape 추론 / 그래프 정리 (실패하면 원본 그대로 양자화)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = model_path
+        try:
+            from onnxruntime.quantization.shape_inference import quant_pre_process
+            source_path = os.path.join(tmp_dir, "preprocessed.onnx")
+            quant_pre_process(model_path, source_path)
+        except Exception as e:
+            print(f"양자화 전처리를 건너뜁니다: {e}")
+            source_path = model_path
+        quantize_static(source_path, output_path, calibration_reader, quant_format=QuantFormat.QDQ,
+                        per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return output_path
+
+
+def evaluate_model(model_path, line_a_path, datasets, seed):
+    """
+    A_TRAIN 메모리 뱅크 (ColorJitter 없음) 로 A_TEST / B_TEST 이미지별 top 10% 평균 점수와 소요 시간 계산
+    """
+    ds_a_training, ds_a_test, ds_b_test = datasets
+    model = load_onnx_model(model_path)
+    loader = lambda ds: DataLoader(ds, batch_size=1, shuffle=False, num_workers=NUM_WORKERS)
+    start = time.perf_counter()
+    mb_mgr = create_memory_bank([line_a_path], model, [loader(ds_a_training)], seed=seed, persist=False)
+    a_maps, _ = compute_anomaly_maps(loader(ds_a_test), mb_mgr, model, desc="[A_TEST Anomaly Maps]")
+    b_maps, _ = compute_anomaly_maps(loader(ds_b_test), mb_mgr, model, desc="[B_TEST Anomaly Maps]")
+    seconds = time.perf_counter() - start
+    return top_mean_scores(a_maps, 0.1), top_mean_scores(b_maps, 0.1), seconds
+
+
+def compare_scores(reference, quantized):
+    """(a_scores, b_scores, seconds) 두 결과의 점수 오차와 B-A 점수 차이 비교"""
+    ref_a, ref_b, ref_seconds = reference
+    q_a, q_b, q_seconds = quantized
+    ref = np.concatenate([ref_a, ref_b])
+    rel = np.abs(np.concatenate([q_a, q_b]) - ref) / np.maximum(np.abs(ref), 1e-12)
+    ref_gap = float(np.mean(ref_b) - np.mean(ref_a))
+    q_gap = float(np.mean(q_b) - np.mean(q_a))
+    return {
+        "score_max_rel_err": float(rel.max()) if rel.size else 0.0,
+        "score_mean_rel_err": float(rel.mean()) if rel.size else 0.0,
+        "gap_fp32": ref_gap,
+        "gap_int8": q_gap,
+        "gap_rel_err": abs(q_gap - ref_gap) / max(abs(ref_gap), 1e-12),
+        "seconds_fp32": round(ref_seconds, 3),
+        "seconds_int8": round(q_seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="백본 모델 INT8 양자화 + FP32 대비 정확도 검증")
+    parser.add_argument("line_a_path", help="첫 번째 이미지 라인 폴더 경로 (보정 / 메모리 뱅크에 A_TRAIN 사용)")
+    parser.add_argument("line_b_path", help="두 번째 이미지 라인 폴더 경로")
+    parser.add_argument("--root", default="", help="root 폴더 (모델: root/models/model.onnx)")
+    parser.add_argument("--method", choices=("static", "dynamic"), default="static",
+                        help="static: 활성값까지 INT8 (A_TRAIN 으로 보정), dynamic: 가중치만 INT8")
+    parser.add_argument("--calibration_images", type=int, default=TRAIN_LIMIT, help="보정에 사용할 A_TRAIN 이미지 수")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="점수 평균 상대 오차와 B-A 점수 차이 상대 오차 허용치 (둘 다 이하이면 통과)")
+    parser.add_argument("--num_threads", type=int, default=None, help="CPU 스레드 수 (없으면 라이브러리 기본값)")
+    parser.add_argument("--seed", type=int, default=0, help="메모리 뱅크 coreset 샘플링 seed (두 모델 동일)")
+    args = parser.parse_args()
+
+    # INT8 모델은 CPU 추론에서만 선택되므로 두 모델 모두 CPU 로 비교
+    os.environ[PROVIDERS_ENV] = "CPUExecutionProvider"
+    if args.num_threads is not None:
+        set_num_threads(args.num_threads)
+
+    model_path = os.path.join(args.root, MODEL_PATH)
+    output_path, report_path = quantized_model_paths(model_path)
+
+    # 이전 보고서는 먼저 삭제 (양자화 / 검증 도중 실패해도 예전 결과로 INT8 모델이 선택되지 않도록)
+    if os.path.exists(report_path):
+        os.remove(report_path)
+
+    # 진행 로그는 stderr 로 보내고 stdout 에는 보고서 JSON 만 출력
+    with contextlib.redirect_stdout(sys.stderr):
+        print(f"[양자화] {model_path} -> {output_path} ({args.method})")
+        datasets = make_datasets(args.line_a_path, args.line_b_path)
+        reader = None
+        if args.method == "static":
+            input_name = load_onnx_model(model_path).get_inputs()[0].name
+            reader = ImageCalibrationReader(datasets[0], input_name, args.calibration_images)
+        quantize(model_path, output_path, args.method, reader)
+
+        print("[검증] FP32 / INT8 anomaly score 비교")
+        metrics = compare_scores(evaluate_model(model_path, args.line_a_path, datasets, args.seed),
+                                 evaluate_model(output_path, args.line_a_path, datasets, args.seed))
+    passed = metrics["score_mean_rel_err"] <= args.tolerance and metrics["gap_rel_err"] <= args.tolerance
+    report = {
+        "source": model_signature(model_path),
+        "method": args.method,
+        "tolerance": args.tolerance,
+        "passed": passed,
+        "metrics": metrics,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    # 통과한 보고서가 있으면 A 가 INT8 모델을 자동으로 사용 (onnx_session.select_model_path)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    print(f"[검증] {'통과' if passed else '실패'}: 보고서 {report_path}", file=sys.stderr)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
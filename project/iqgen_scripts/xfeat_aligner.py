@@ -2,12 +2,16 @@ import os
 import time
 import numpy as np
 import cv2
-import onnxruntime as ort
 from tqdm import tqdm
 import argparse
-import json
 import sys
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__))) # windows 배포 시, 같은 경로 파일 import 위해 필요
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE" # windows 배포 시, ONNX 와 FAISS 의 OpenMP 충돌 우회를 위해 필요
+
+from progress import report_progress, emit_message
+from onnx_session import create_session
+
 class XFeatAligner:
     def __init__(self, model_path, input_size=512):
         """
@@ -19,7 +23,7 @@ class XFeatAligner:
         """
         self.input_size = input_size
         self.model_path = model_path
-        self.session = ort.InferenceSession(model_path, providers=["CUDAExecutionProvider"])
+        self.session = create_session(model_path)
     
     def _load_model(self, provider="CPUExecutionProvider"):
         """
@@ -28,7 +32,7 @@ class XFeatAligner:
         매개변수:
             provider: ONNX 실행 공급자 ("CPUExecutionProvider" 또는 "CUDAExecutionProvider")
         """
-        session = ort.InferenceSession(self.model_path, providers=[provider])
+        session = create_session(self.model_path, providers=[provider])
         print(session.get_providers())
         return session
     
@@ -289,19 +293,6 @@ def find_first_image_in_folder(folder_path):
     # 첫 번째 이미지의 전체 경로 반환
     return os.path.join(folder_path, img_list[0])
 
-def report_progress(progress):
-    """
-    진행 상황을 Electron에 보고하는 함수
-    
-    매개변수:
-        progress: 0에서 100 사이의 진행률 
-    """
-    # JSON 형식으로 진행 상황 보고
-    progress_data = {
-        "progress": round(progress, 2)
-    }
-    print(json.dumps(progress_data), flush=True)
-
 def main():
     # 명령줄 인수 파싱
     parser = argparse.ArgumentParser(description='XFeat 이미지 정렬 도구')
@@ -357,7 +348,7 @@ def main():
         "progress": 100,
         "status": "complete"
     }
-    print(json.dumps(completion_data), flush=True)
+    emit_message(completion_data)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,235 @@
+import requests
+import time
+import json
+import argparse
+import os
+import sys
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import traceback
+
+from test_client import func
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'python_scripts', 'test_local_server.py')
+
+# test_client.func 가 사용하는 파라미터 (lr, arc) 에 맞춘 부하 테스트용 config
+BENCH_CONFIG = [
+    {"name": "lr", "type": "float", "min": "0.001",
+        "max": "0.1", "step": "0.001", "log": "linear"},
+    {"name": "arc", "type": "category", "categories": "mm,nn"}
+]
+
+
+def find_free_port():
+    """로컬에서 사용 가능한 포트 번호 반환"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, root):
+    """
+    임시 root 에 config.json 을 만들고 test_local_server.py 를 로컬 포트로 기동
+    """
+    os.makedirs(os.path.join(root, 'json_files'), exist_ok=True)
+    with open(os.path.join(root, 'json_files', 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(BENCH_CONFIG, f)
+
+    proc = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--port", str(port), "--root", root],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return proc
+
+
+def wait_for_server(server_url, proc, timeout=30):
+    """서버가 요청을 받을 수 있을 때까지 대기 (존재하지 않는 study 의 /best 는 404)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"서버 프로세스가 종료되었습니다 (exit code {proc.returncode})")
+        try:
+            requests.get(f"{server_url}/best?study_id=__ping__", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{timeout}초 안에 서버가 응답하지 않습니다: {server_url}")
+
+
+def percentile(values, q):
+    """정렬 후 선형 보간으로 q(0~100) 백분위수 계산"""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def summarize(latencies, errors, elapsed):
+    """
+    요청 종류별 지연시간(초) 리스트와 에러 수로 통계 dict 생성
+    """
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / total, 6) if total else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed > 0 else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else None,
+    }
+
+
+class ClientStats:
+    """클라이언트 스레드들이 공유하는 결과 수집기"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {"ask": [], "tell": []}
+        self.errors = {"ask": 0, "tell": 0}
+
+    def record(self, kind, latency=None):
+        with self.lock:
+            if latency is None:
+                self.errors[kind] += 1
+            else:
+                self.latencies[kind].append(latency)
+
+
+def client_loop(client_id, server_url, study_id, num_trials, eval_delay, stats):
+    """
+    한 클라이언트: ask(/trial) -> 평가(func + eval_delay) -> tell(/score) 반복
+    같은 study 의 다른 클라이언트 trial 을 취소하지 않도록 concurrent 모드와 trial_id 사용
+    재시도 없이 각 요청의 지연시간과 실패를 그대로 기록
+    """
+    session = requests.Session()
+    for _ in range(num_trials):
+        # ask
+        start = time.perf_counter()
+        try:
+            response = session.get(f"{server_url}/trial?study_id={study_id}&concurrent=1", timeout=30)
+            latency = time.perf_counter() - start
+            if response.status_code != 200:
+                stats.record("ask")
+                continue
+            data = response.json()
+            trial_id, params = data["trial_id"], data["params"]
+            stats.record("ask", latency)
+        except (requests.RequestException, ValueError, KeyError):
+            stats.record("ask")
+            continue
+
+        # 평가
+        score = func(**params)
+        if eval_delay > 0:
+            time.sleep(eval_delay)
+
+        # tell
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{server_url}/score?study_id={study_id}",
+                                    json={"score": score, "trial_id": trial_id}, timeout=30)
+            latency = time.perf_counter() - start
+            if response.status_code == 200:
+                stats.record("tell", latency)
+            else:
+                stats.record("tell")
+        except requests.RequestException:
+            stats.record("tell")
+    session.close()
+
+
+def run_load_test(server_url, num_clients, num_studies, trials_per_client, eval_delay):
+    """
+    num_clients 개의 클라이언트를 num_studies 개의 study 에 round-robin 으로 배정해 동시에 실행
+    """
+    stats = ClientStats()
+    run_tag = str(int(time.time()))
+    threads = []
+    for i in range(num_clients):
+        study_id = f"bench{run_tag}_{i % num_studies}"
+        t = threading.Thread(target=client_loop, args=(
+            i, server_url, study_id, trials_per_client, eval_delay, stats), daemon=True)
+        threads.append(t)
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "config": {
+            "clients": num_clients,
+            "studies": num_studies,
+            "trials_per_client": trials_per_client,
+            "eval_delay_s": eval_delay,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "ask": summarize(stats.latencies["ask"], stats.errors["ask"], elapsed),
+        "tell": summarize(stats.latencies["tell"], stats.errors["tell"], elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HPO 서버 부하 테스트")
+    parser.add_argument("--server_url", type=str, default=None,
+                        help="이미 떠 있는 서버 URL (없으면 로컬 포트에 서버를 직접 기동)")
+    parser.add_argument("--clients", type=int, default=8, help="동시 클라이언트 수 (M)")
+    parser.add_argument("--studies", type=int, default=2, help="study 수 (S)")
+    parser.add_argument("--trials", type=int, default=20, help="클라이언트당 trial 수")
+    parser.add_argument("--eval_delay", type=float, default=0.0, help="trial 평가 지연시간(초)")
+    parser.add_argument("--output", type=str, default=None, help="결과 JSON 저장 경로 (없으면 stdout)")
+    args = parser.parse_args()
+
+    proc = None
+    root = None
+    server_url = args.server_url
+    try:
+        if server_url is None:
+            root = tempfile.mkdtemp(prefix="hpo_bench_")
+            port = find_free_port()
+            server_url = f"http://127.0.0.1:{port}"
+            proc = start_server(port, root)
+            wait_for_server(server_url, proc)
+            print(f"[Bench] 로컬 서버 기동: {server_url} (root={root})", file=sys.stderr)
+
+        result = run_load_test(server_url, args.clients, args.studies, args.trials, args.eval_delay)
+        result["server_url"] = server_url
+
+        report = json.dumps(result, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(report)
+            print(f"[Bench] 결과 저장: {args.output}", file=sys.stderr)
+        else:
+            print(report)
+
+    except KeyboardInterrupt:
+        print("\n[Bench] 사용자에 의해 중단되었습니다.", file=sys.stderr)
+    except Exception as e:
+        print(f"[Bench] 오류 발생: {e}", file=sys.stderr)
+        traceback.print_exc()
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if root is not None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,17 @@ import argparse
 import traceback
 import optuna
 import os
+import io
+import csv
 import json
+import sqlite3
+import importlib.util
 import threading
 import time
 import sys
 import urllib.parse
 import uuid
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 sys.stdout.reconfigure(line_buffering=True)
 
@@ -17,7 +21,8 @@ sys.stdout.reconfigure(line_buffering=True)
 # key   = study_id (str)
 # value = {
 #     "study": optuna.Study 인스턴스
-#     "pending_trial": 현재 진행 중인 trial 정보 (파라미터, trial 객체)
+#     "pending_trials": {trial.number: 진행 중인 trial 정보 (파라미터, trial 객체)}
+#     "failed_trials": {trial.number: 실패 처리된 trial 정보} - 늦게 받은 점수 재제출용, 재제출되면 제거
 #     "completed_trials": [완료된 trial 정보들의 리스트]
 #     "client_trial_count": 클라이언트에게 제공된 trial 수
 #     "study_lock": threading.Lock() - study 접근을 위한 락
@@ -25,6 +30,7 @@ sys.stdout.reconfigure(line_buffering=True)
 # }
 # ------------------------------------------------------------------------------
 active_studies = {}
+studies_lock = threading.Lock()  # active_studies 에 새 study 를 추가할 때 사용하는 락
 
 # ------------------------------------------------------------------------------
 # JSON config를 읽어 파라미터를 뽑아내는 클래스
@@ -86,6 +92,11 @@ def get_or_create_study(study_id, root):
     """study_id에 해당하는 study를 가져오거나 새로 생성"""
     global active_studies
 
+    with studies_lock:
+        return _get_or_create_study(study_id, root)
+
+
+def _get_or_create_study(study_id, root):
     # 이미 있는 경우 반환
     if study_id in active_studies:
         return active_studies[study_id]
@@ -109,7 +120,8 @@ def get_or_create_study(study_id, root):
         # 정보 저장
         active_studies[study_id] = {
             "study": study,
-            "pending_trial": None,  # 현재 진행 중인 trial (없음)
+            "pending_trials": {},  # 진행 중인 trial들 (trial.number -> trial 정보)
+            "failed_trials": {},  # 실패 처리된 trial들 (trial.number -> trial 정보), 재제출되면 제거
             "completed_trials": [],  # 완료된 trial들
             "client_trial_count": 0,  # 클라이언트에게 제공된 trial 수
             "study_lock": threading.Lock(),  # study 접근을 위한 락
@@ -125,8 +137,26 @@ def get_or_create_study(study_id, root):
         return None
 
 
-def create_new_trial(study_id, root):
-    """새로운 trial을 생성하고 파라미터 반환"""
+def fail_pending_trial(study_id, study_info, trial_id):
+    """진행 중인 trial을 실패로 표시하고 목록에서 제거 (study_lock 안에서 호출)"""
+    trial_info = study_info["pending_trials"].pop(trial_id)
+    old_trial = trial_info["trial"]
+    study_info["failed_trials"][trial_id] = trial_info
+    try:
+        # Trial을 실패로 표시하여 미완료 상태 정리
+        study_info["study"].tell(
+            old_trial.number, state=optuna.trial.TrialState.FAIL)
+    except Exception as e:
+        print(f"[{study_id}] 이전 trial 취소 중 오류: {e}")
+
+
+def create_new_trial(study_id, root, concurrent=False):
+    """
+    새로운 trial을 생성하고 trial 정보 반환
+
+    concurrent=False 이면 기존처럼 진행 중인 trial을 모두 취소하고,
+    True 이면 여러 trial을 동시에 진행 중으로 유지 (점수 제출 시 trial_id 로 구분)
+    """
     global active_studies
 
     study_info = get_or_create_study(study_id, root)
@@ -135,15 +165,10 @@ def create_new_trial(study_id, root):
 
     with study_info["study_lock"]:
         # 이미 진행 중인 trial이 있으면, 이전 trial은 취소 처리
-        if study_info["pending_trial"]:
+        if not concurrent and study_info["pending_trials"]:
             print(f"[{study_id}] 이전 trial 취소 (클라이언트가 점수를 보내지 않음)")
-            old_trial = study_info["pending_trial"]["trial"]
-            try:
-                # Trial을 실패로 표시하여 미완료 상태 정리
-                study_info["study"].tell(
-                    old_trial.number, state=optuna.trial.TrialState.FAIL)
-            except Exception as e:
-                print(f"[{study_id}] 이전 trial 취소 중 오류: {e}")
+            for trial_id in list(study_info["pending_trials"]):
+                fail_pending_trial(study_id, study_info, trial_id)
 
         # 새로운 trial 생성
         try:
@@ -162,12 +187,12 @@ def create_new_trial(study_id, root):
                 # 클라이언트가 볼 번호
                 "trial_number": study_info["client_trial_count"] + 1
             }
-            study_info["pending_trial"] = trial_info
+            study_info["pending_trials"][trial.number] = trial_info
             study_info["client_trial_count"] += 1
 
             print(
                 f"[{study_id}] 새 trial #{trial_info['trial_number']} 생성: trial.number={trial.number}, params={params}")
-            return params
+            return trial_info
 
         except Exception as e:
             print(f"[{study_id}] Trial 생성 중 오류: {e}")
@@ -175,8 +200,70 @@ def create_new_trial(study_id, root):
             return None
 
 
-def submit_trial_score(study_id, score):
-    """현재 진행 중인 trial에 점수 제출"""
+def record_completed_trial(study_id, study_info, trial_info, score, user_attrs=None):
+    """완료된 trial을 목록에 추가하고 best 갱신 (study_lock 안에서 호출), user_attrs 의 seed / settings 는 best 와 함께 보관"""
+    # 점수 기록
+    trial_info["score"] = score
+    trial_info["end_time"] = time.time()
+
+    # 완료된 trial 목록에 추가
+    study_info["completed_trials"].append(trial_info)
+
+    # best 갱신 확인
+    if study_info["best_params"] is None or score > study_info["best_params"]["score"]:
+        study_info["best_params"] = {
+            "params": trial_info["params"],
+            "score": score,
+            "trial_number": trial_info["trial_number"],
+            "trial_id": trial_info["trial"].number,  # 클라이언트가 점수 제출에 사용한 trial_id
+            "seed": (user_attrs or {}).get("seed"),  # 같은 결과를 재현할 trial seed
+            "settings": (user_attrs or {}).get("settings")  # 점수에 영향을 주는 클라이언트 평가 설정
+        }
+
+    print(f"[{study_id}] Trial #{trial_info['trial_number']} 완료: score={score}, best_so_far={study_info['best_params']['score']}")
+
+
+def resubmit_failed_trial(study_id, study_info, score, trial_id, user_attrs=None):
+    """
+    이미 실패 처리된 trial의 점수를 늦게 받은 경우 (예: 클라이언트 재시작 후 journal 재제출)
+    같은 파라미터로 완료된 trial을 새로 추가하여 계산 결과를 버리지 않음 (study_lock 안에서 호출)
+    trial 하나는 한 번만 재제출 가능 (추가한 trial 의 user_attrs["resubmitted_from"] 에 원래 trial_id 기록)
+    """
+    study = study_info["study"]
+    failed_info = study_info["failed_trials"].get(trial_id)
+    if failed_info is None:
+        print(f"[{study_id}] 진행 중이거나 아직 재제출되지 않은 실패 trial({trial_id})이 아니어서 점수 제출 불가")
+        return False
+
+    old_trial = failed_info["trial"]
+    user_attrs = {**old_trial.user_attrs, **(user_attrs or {}), "resubmitted_from": trial_id}
+    study.add_trial(optuna.trial.create_trial(
+        params=failed_info["params"],
+        distributions=old_trial.distributions,
+        value=score,
+        user_attrs=user_attrs
+    ))
+    del study_info["failed_trials"][trial_id]
+    # study_lock 안이므로 마지막 trial 이 방금 추가한 trial
+    new_number = study.get_trials(deepcopy=False)[-1].number
+    trial_info = {
+        "trial": old_trial,  # best 의 trial_id 는 클라이언트가 제출에 사용한 원래 번호
+        "params": failed_info["params"],
+        "start_time": failed_info["start_time"],
+        "trial_number": new_number
+    }
+    print(f"[{study_id}] 실패 처리된 trial({trial_id})의 점수를 새 trial(trial.number={new_number})로 재제출")
+    record_completed_trial(study_id, study_info, trial_info, score, user_attrs)
+    return True
+
+
+def submit_trial_score(study_id, score, trial_id=None, user_attrs=None):
+    """
+    진행 중인 trial에 점수 제출
+    trial_id 가 없으면 가장 최근에 생성된 trial에 제출
+    trial_id 가 이미 실패 처리된 trial이면 같은 파라미터의 완료된 trial로 추가
+    user_attrs 는 trial 의 user attribute 로 저장 (예: 재현용 seed)
+    """
     global active_studies
 
     if study_id not in active_studies:
@@ -186,36 +273,29 @@ def submit_trial_score(study_id, score):
     study_info = active_studies[study_id]
 
     with study_info["study_lock"]:
-        if not study_info["pending_trial"]:
-            print(f"[{study_id}] 진행 중인 trial이 없는데 점수 제출 시도")
-            return False
+        if trial_id is None:
+            if not study_info["pending_trials"]:
+                print(f"[{study_id}] 진행 중인 trial이 없는데 점수 제출 시도")
+                return False
+            trial_id = next(reversed(study_info["pending_trials"]))
 
         try:
-            trial_info = study_info["pending_trial"]
+            if trial_id not in study_info["pending_trials"]:
+                return resubmit_failed_trial(study_id, study_info, score, trial_id, user_attrs)
+
+            trial_info = study_info["pending_trials"][trial_id]
             trial = trial_info["trial"]
 
-            # 점수 기록
-            trial_info["score"] = score
-            trial_info["end_time"] = time.time()
+            # user attribute 기록 (완료 처리 전에 해야 함)
+            for key, value in (user_attrs or {}).items():
+                trial.set_user_attr(key, value)
 
             # 완료로 표시
             study_info["study"].tell(trial.number, score)
+            record_completed_trial(study_id, study_info, trial_info, score, user_attrs)
 
-            # 완료된 trial 목록에 추가
-            study_info["completed_trials"].append(trial_info)
-
-            # best 갱신 확인
-            if study_info["best_params"] is None or score > study_info["best_params"]["score"]:
-                study_info["best_params"] = {
-                    "params": trial_info["params"],
-                    "score": score,
-                    "trial_number": trial_info["trial_number"]
-                }
-
-            print(f"[{study_id}] Trial #{trial_info['trial_number']} 완료: score={score}, best_so_far={study_info['best_params']['score']}")
-
-            # pending trial 초기화
-            study_info["pending_trial"] = None
+            # pending trial 목록에서 제거
+            del study_info["pending_trials"][trial_id]
             return True
 
         except Exception as e:
@@ -224,8 +304,34 @@ def submit_trial_score(study_id, score):
             return False
 
 
+def cancel_trial(study_id, trial_id):
+    """점수를 제출하지 않을 trial을 실패로 표시 (예: 미리 받아둔 뒤 사용하지 않은 trial)"""
+    global active_studies
+
+    if study_id not in active_studies:
+        print(f"[{study_id}] 존재하지 않는 study의 trial 취소 시도")
+        return False
+
+    study_info = active_studies[study_id]
+
+    with study_info["study_lock"]:
+        if trial_id not in study_info["pending_trials"]:
+            print(f"[{study_id}] 진행 중이 아닌 trial({trial_id}) 취소 시도")
+            return False
+
+        fail_pending_trial(study_id, study_info, trial_id)
+        print(f"[{study_id}] Trial(trial.number={trial_id}) 취소 완료")
+        return True
+
+
 def get_best_params(study_id):
     """현재까지의 최고 파라미터 반환"""
+    best_info = get_best_trial(study_id)
+    return best_info["params"] if best_info else None
+
+
+def get_best_trial(study_id):
+    """현재까지의 최고 trial 정보 (params, score, trial_number, trial_id, seed, settings) 반환"""
     global active_studies
 
     if study_id not in active_studies:
@@ -249,15 +355,180 @@ def get_best_params(study_id):
             n_completed = len(study_info["completed_trials"])
             n_total = study_info["client_trial_count"]
             print(f"[{study_id}] 통계: 총 {n_total}개 trial 중 {n_completed}개 완료됨")
-            return best_info["params"]
+            return dict(best_info)
 
         return None
 
 
+# ------------------------------------------------------------------------------
+# Trial 이력 export 관련 함수들
+# optuna 의 FrozenTrial 을 만들지 않고 db.sqlite3 에서 직접 컬럼 단위로 읽어온다.
+# ------------------------------------------------------------------------------
+EXPORT_FORMATS = ("csv", "npz", "parquet")
+EXPORT_CHUNK_SIZE = 5000
+# 컬럼 타입 (chunk 마다 추론하지 않고 export 전체에서 같은 타입 사용)
+EXPORT_INT, EXPORT_FLOAT, EXPORT_STR = "int", "float", "str"
+
+
+def find_storage_study(conn, study_id):
+    """
+    study_id(클라이언트 ID)에 해당하는 storage 상의 (study 번호, study 이름) 반환
+    서버 재시작 후에도 export 할 수 있도록, 메모리에 없으면 가장 최근 study_{id}_* 를 찾는다
+    """
+    study_info = active_studies.get(study_id)
+    if study_info:
+        study_name = study_info["study"].study_name
+        row = conn.execute(
+            "SELECT study_id, study_name FROM studies WHERE study_name = ?", (study_name,)).fetchone()
+        return row
+
+    prefix = f"study_{study_id}_"
+    return conn.execute(
+        "SELECT study_id, study_name FROM studies WHERE substr(study_name, 1, ?) = ? "
+        "ORDER BY study_id DESC LIMIT 1",
+        (len(prefix), prefix)).fetchone()
+
+
+def iter_trial_columns(conn, storage_study_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    study 의 trial 이력을 chunk 단위 컬럼 dict 로 반환하는 제너레이터
+
+    첫 번째 yield 는 {컬럼 이름: 컬럼 타입} (컬럼 순서대로), 이후에는 {컬럼 이름: 값 리스트} 형태의 chunk.
+    컬럼 타입은 분포로 정함: number 는 int, state / categorical 파라미터는 str (값도 문자열로 변환),
+    score / duration / 나머지 파라미터는 float. 값이 모두 None 인 chunk 가 있어도 타입이 바뀌지 않음.
+    파라미터는 SQL 에서 피벗하므로 trial 당 Python 객체를 만들지 않는다.
+    """
+    # 파라미터 이름과 분포 (categorical 은 내부 index -> 실제 값 변환 필요)
+    param_rows = conn.execute(
+        "SELECT p.param_name, MAX(p.distribution_json) FROM trial_params p "
+        "JOIN trials t ON t.trial_id = p.trial_id WHERE t.study_id = ? "
+        "GROUP BY p.param_name ORDER BY p.param_name",
+        (storage_study_id,)).fetchall()
+    param_names = [name for name, _ in param_rows]
+    param_choices = {}
+    for name, dist_json in param_rows:
+        try:
+            dist = json.loads(dist_json)
+            if dist.get("name") == "CategoricalDistribution":
+                param_choices[name] = dist["attributes"]["choices"]
+        except (TypeError, ValueError, KeyError):
+            pass
+
+    param_select = "".join(
+        ", MAX(CASE WHEN p.param_name = ? THEN p.param_value END)" for _ in param_names)
+    query = (
+        "SELECT t.number, t.state, v.value, "
+        "(julianday(t.datetime_complete) - julianday(t.datetime_start)) * 86400.0"
+        f"{param_select} "
+        "FROM trials t "
+        "LEFT JOIN trial_values v ON v.trial_id = t.trial_id AND v.objective = 0 "
+        "LEFT JOIN trial_params p ON p.trial_id = t.trial_id "
+        "WHERE t.study_id = ? GROUP BY t.trial_id ORDER BY t.number"
+    )
+    columns = ["number", "state", "score", "duration"] + [f"params_{n}" for n in param_names]
+    column_types = {"number": EXPORT_INT, "state": EXPORT_STR, "score": EXPORT_FLOAT, "duration": EXPORT_FLOAT}
+    for name in param_names:
+        column_types[f"params_{name}"] = EXPORT_STR if name in param_choices else EXPORT_FLOAT
+    yield column_types
+
+    cursor = conn.execute(query, (*param_names, storage_study_id))
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunk = dict(zip(columns, (list(col) for col in zip(*rows))))
+        # categorical 파라미터는 index 를 실제 선택지 (문자열) 로 변환
+        for name, choices in param_choices.items():
+            key = f"params_{name}"
+            chunk[key] = [None if v is None else str(choices[int(v)]) for v in chunk[key]]
+        yield chunk
+
+
+def write_csv_export(wfile, chunks, column_types):
+    """chunk 마다 CSV 행을 바로 전송"""
+    columns = list(column_types)
+    text = io.TextIOWrapper(wfile, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(zip(*(chunk[c] for c in columns)))
+    text.detach()
+
+
+def write_npz_export(wfile, chunks, column_types):
+    """
+    chunk 를 컬럼별 numpy 배열로 변환해 모은 뒤 하나의 npz 로 전송
+    npz 는 컬럼마다 .npy 하나이므로 컬럼 배열은 끝까지 모아야 하지만, zip 파일 자체는 메모리에 만들지 않고 바로 기록
+    컬럼 dtype 은 column_types 로 한 번 정함 (int: int64, float: float64 / None 은 nan, str: 문자열 / None 은 "")
+    """
+    import numpy as np
+
+    def to_array(values, column_type):
+        if column_type == EXPORT_INT:
+            return np.asarray(values, dtype=np.int64)
+        if column_type == EXPORT_FLOAT:
+            return np.asarray([np.nan if v is None else v for v in values], dtype=np.float64)
+        return np.asarray(["" if v is None else v for v in values], dtype=str)
+
+    parts = {c: [] for c in column_types}
+    for chunk in chunks:
+        for c, column_type in column_types.items():
+            parts[c].append(to_array(chunk[c], column_type))
+
+    arrays = {c: np.concatenate(parts[c]) if parts[c] else to_array([], column_type)
+              for c, column_type in column_types.items()}
+    # zipfile 은 seek 할 수 없는 출력이면 data descriptor 방식으로 순서대로 기록
+    np.savez(wfile, **arrays)
+
+
+def write_parquet_export(wfile, chunks, column_types):
+    """
+    chunk 마다 parquet row group 하나를 바로 전송 (pyarrow 필요, footer 는 마지막에 기록)
+    schema 는 column_types 로 미리 정함 (값이 모두 None 인 chunk 도 같은 schema 로 기록)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {EXPORT_INT: pa.int64(), EXPORT_FLOAT: pa.float64(), EXPORT_STR: pa.string()}
+    schema = pa.schema([(c, arrow_types[t]) for c, t in column_types.items()])
+
+    # parquet 은 앞에서부터 순서대로 쓰므로 seek 할 수 없는 소켓에도 기록 가능 (위치는 PythonFile 이 직접 셈)
+    sink = pa.PythonFile(wfile, mode="w")
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in chunks:
+        writer.write_table(pa.table({c: chunk[c] for c in column_types}, schema=schema))
+    writer.close()
+
+
+# format 별로 필요한 선택적 패키지 (csv 는 표준 라이브러리만 사용)
+EXPORT_REQUIREMENTS = {
+    "npz": "numpy",
+    "parquet": "pyarrow",
+}
+
+EXPORT_WRITERS = {
+    "csv": (write_csv_export, "text/csv; charset=utf-8"),
+    "npz": (write_npz_export, "application/octet-stream"),
+    "parquet": (write_parquet_export, "application/octet-stream"),
+}
+
+
 # ------------------------------------------------------------------------------
 # HTTP 핸들러
 # ------------------------------------------------------------------------------
 class SimpleHandler(BaseHTTPRequestHandler):
+    # keep-alive 연결을 지원하여 클라이언트가 요청마다 새 TCP 연결을 열지 않도록 함
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, response, status=200):
+        """JSON 응답 전송 (keep-alive 를 위해 Content-Length 포함)"""
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_GET(self):
         parsed_path = urllib.parse.urlparse(self.path)
         path = parsed_path.path
@@ -270,21 +541,19 @@ class SimpleHandler(BaseHTTPRequestHandler):
             study_id = str(uuid.uuid4())[:8]  # 짧은 ID 생성
 
         if path == "/trial":
-            # 새 파라미터 얻기
-            params = create_new_trial(study_id, args.root)
+            # 새 파라미터 얻기 (concurrent=1 이면 다른 진행 중 trial을 취소하지 않음)
+            concurrent = query.get("concurrent", ["0"])[0] == "1"
+            trial_info = create_new_trial(study_id, args.root, concurrent=concurrent)
 
-            if params:
+            if trial_info:
                 # 성공
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-
-                # study_id도 응답에 포함
+                # study_id, 점수 제출 시 사용할 trial_id 도 응답에 포함
                 response = {
                     "study_id": study_id,
-                    "params": params
+                    "trial_id": trial_info["trial"].number,
+                    "params": trial_info["params"]
                 }
-                self.wfile.write(json.dumps(response).encode("utf-8"))
+                self.send_json(response)
             else:
                 # 실패
                 self.send_error(500, "Failed to create trial")
@@ -295,27 +564,86 @@ class SimpleHandler(BaseHTTPRequestHandler):
                 self.send_error(400, "Missing study_id parameter")
                 return
 
-            best_params = get_best_params(study_id)
+            best_info = get_best_trial(study_id)
 
-            if best_params:
+            if best_info:
                 # 성공
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-
-                # study_id도 응답에 포함
+                # study_id, best trial 의 trial_id / 점수도 응답에 포함
                 response = {
                     "study_id": study_id,
-                    "params": best_params
+                    "params": best_info["params"],
+                    "trial_id": best_info["trial_id"],
+                    "seed": best_info.get("seed"),
+                    "settings": best_info.get("settings"),
+                    "score": best_info["score"]
                 }
-                self.wfile.write(json.dumps(response).encode("utf-8"))
+                self.send_json(response)
             else:
                 # 실패
                 self.send_error(404, "No best parameters available")
 
+        elif path == "/export":
+            self.handle_export(query)
+
         else:
             self.send_error(404, "Not Found")
 
+    def handle_export(self, query):
+        """
+        /export?study_id=..&format=npz|csv|parquet
+        csv / parquet 는 chunk 단위로 바로 전송, npz 는 컬럼 배열을 모두 모은 뒤 전송 (npz 형식상 컬럼별 배열이 통째로 필요)
+        """
+        if "study_id" not in query:
+            self.send_error(400, "Missing study_id parameter")
+            return
+        study_id = query["study_id"][0]
+        fmt = query.get("format", ["csv"])[0]
+        if fmt not in EXPORT_FORMATS:
+            self.send_error(400, f"Unsupported format: {fmt}")
+            return
+        required = EXPORT_REQUIREMENTS.get(fmt)
+        if required and importlib.util.find_spec(required) is None:
+            self.send_error(501, f"Format '{fmt}' requires the '{required}' package")
+            return
+
+        db_path = os.path.join(args.root, "db.sqlite3")
+        if not os.path.exists(db_path):
+            self.send_error(404, "Storage not found")
+            return
+
+        try:
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        except sqlite3.Error as e:
+            self.send_error(500, f"Failed to open storage: {e}")
+            return
+
+        try:
+            row = find_storage_study(conn, study_id)
+            if row is None:
+                self.send_error(404, "Study not found")
+                return
+            storage_study_id, study_name = row
+
+            writer, content_type = EXPORT_WRITERS[fmt]
+            chunks = iter_trial_columns(conn, storage_study_id)
+            column_types = next(chunks)
+
+            self.send_response(200)
+            self.send_header("Content-type", content_type)
+            self.send_header("Content-Disposition", f'attachment; filename="{study_name}.{fmt}"')
+            # 길이를 미리 알 수 없으므로 전송 후 연결 종료
+            self.send_header("Connection", "close")
+            self.close_connection = True
+            self.end_headers()
+            writer(self.wfile, chunks, column_types)
+            print(f"[{study_id}] Trial 이력 export 완료: format={fmt}, study={study_name}")
+
+        except Exception as e:
+            print(f"[{study_id}] Trial 이력 export 중 오류: {e}")
+            traceback.print_exc()
+        finally:
+            conn.close()
+
     def do_POST(self):
         parsed_path = urllib.parse.urlparse(self.path)
         path = parsed_path.path
@@ -336,21 +664,23 @@ class SimpleHandler(BaseHTTPRequestHandler):
                 data = json.loads(body)
                 # "score" 또는 "auroc" 필드 사용
                 score = float(data.get("score", data.get("auroc", 0.0)))
+                trial_id = data.get("trial_id")
+                if trial_id is not None:
+                    trial_id = int(trial_id)
+                user_attrs = data.get("user_attrs")
+                if user_attrs is not None and not isinstance(user_attrs, dict):
+                    raise ValueError("user_attrs must be an object")
 
                 # 점수 제출
-                success = submit_trial_score(study_id, score)
+                success = submit_trial_score(study_id, score, trial_id, user_attrs)
 
                 if success:
                     # 성공
-                    self.send_response(200)
-                    self.send_header("Content-type", "application/json")
-                    self.end_headers()
-
                     response = {
                         "study_id": study_id,
                         "status": "success"
                     }
-                    self.wfile.write(json.dumps(response).encode("utf-8"))
+                    self.send_json(response)
                 else:
                     # 실패
                     self.send_error(400, "Failed to submit score")
@@ -360,6 +690,29 @@ class SimpleHandler(BaseHTTPRequestHandler):
             except ValueError:
                 self.send_error(400, "Invalid score value")
 
+        elif path == "/cancel":
+            # 요청 바디 파싱
+            content_length = int(self.headers["Content-Length"])
+            body = self.rfile.read(content_length).decode("utf-8")
+
+            try:
+                data = json.loads(body)
+                trial_id = int(data["trial_id"])
+
+                if cancel_trial(study_id, trial_id):
+                    response = {
+                        "study_id": study_id,
+                        "status": "cancelled"
+                    }
+                    self.send_json(response)
+                else:
+                    self.send_error(400, "Failed to cancel trial")
+
+            except json.JSONDecodeError:
+                self.send_error(400, "Invalid JSON")
+            except (KeyError, ValueError):
+                self.send_error(400, "Invalid trial_id value")
+
         else:
             self.send_error(404, "Not Found")
 
@@ -381,7 +734,7 @@ if __name__ == "__main__":
         # 웹서버 기동
         host = "0.0.0.0"
         port = args.port
-        server = HTTPServer((host, port), SimpleHandler)
+        server = ThreadingHTTPServer((host, port), SimpleHandler)
         print(f"Server started: http://{host}:{port}")
 
         # 서버 메인루프